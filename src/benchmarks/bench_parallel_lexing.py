@@ -0,0 +1,78 @@
+'''Compare single-process lexing with the process pool on generated input.
+
+Run from the src directory:
+
+    python -m benchmarks.bench_parallel_lexing [line_count] [workers]
+
+Both runs must produce the same spans; the pool only pays off with several
+cores and inputs well past ParallelLexer.threshold_lines.'''
+import random
+import sys
+import time
+
+from pygments.lexers import get_lexer_by_name
+from quiet_incremental_lexer import IncrementalLexer, NEWLINE
+from quiet_parallel_lexer import ParallelLexer
+
+FUNCTION = '''def function_{n}(value, *args, **kwargs):
+    # comment number {n}
+    result = [item * {n} for item in range(value) if item % 7]
+    return "string {n}", 'other', 0x{n:x}, {n}.5
+
+'''
+
+DOCSTRING = '''SOURCE_{n} = """
+A multi-line string
+
+that has blank lines followed by unindented text,
+so some cuts land inside it.
+"""
+
+'''
+
+
+def make_document(line_count, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    lines = 0
+    n = 0
+    while lines < line_count:
+        block = (DOCSTRING if rng.random() < 0.1 else FUNCTION).format(n=n)
+        parts.append(block)
+        lines += block.count('\n')
+        n += 1
+    return ''.join(parts)
+
+
+def main(line_count, workers):
+    text = make_document(line_count)
+    offsets = [0]
+    offsets.extend(m.end() for m in NEWLINE.finditer(text))
+    line_count = len(offsets) - 1
+
+    def fetch(first, last):
+        return text, offsets[first - 1]
+
+    print('%d lines, %d workers' % (line_count, workers))
+
+    single = IncrementalLexer(get_lexer_by_name('python'), line_count)
+    start = time.perf_counter()
+    single_spans = single.relex(fetch)[2]
+    print('single process %8.2f s' % (time.perf_counter() - start))
+
+    parallel_lexer = ParallelLexer(workers)
+    # start the pool outside the timing
+    parallel_lexer.lex(IncrementalLexer(get_lexer_by_name('python'), 2), 'a\nb\n', [0, 2, 4])
+    parallel = IncrementalLexer(get_lexer_by_name('python'), line_count)
+    start = time.perf_counter()
+    parallel_spans = parallel_lexer.lex(parallel, text, offsets)
+    print('process pool   %8.2f s' % (time.perf_counter() - start))
+    parallel_lexer.shutdown()
+
+    print('identical spans: %s' % (single_spans == parallel_spans and single.states == parallel.states))
+
+
+if __name__ == '__main__':
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else ParallelLexer().max_workers
+    main(line_count, workers)
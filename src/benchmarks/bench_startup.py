@@ -0,0 +1,78 @@
+'''Measure the editor's import time and config loading without a display.
+
+Run from the src directory:
+
+    python -m benchmarks.bench_startup [runs]
+
+Each run is a fresh interpreter started with -X importtime, importing
+quiet_app_launch and then loading every config the editor reads at
+startup, first with an empty snapshot cache and then with the snapshot
+the first load wrote. Medians are reported, with the slowest modules of
+the last run. Tk's own startup is not included; for the whole editor use
+quiet_app_launch.py --startup-profile.'''
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = '''
+import time
+start = time.perf_counter()
+import quiet_app_launch
+imported = time.perf_counter()
+from quiet_loaders import QuietLoaders, save_config_snapshot
+loader = QuietLoaders()
+loader.load_settings_data()
+loader.load_default_theme()
+loader.load_default_syntax()
+loaded = time.perf_counter()
+save_config_snapshot()
+print(imported - start, loaded - imported, 'yaml' in sys.modules, 'pygments' in sys.modules)
+'''
+
+
+def run(cache_dir):
+    env = dict(os.environ, XDG_CACHE_HOME=cache_dir)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import sys' + SCRIPT],
+                            env=env, capture_output=True, text=True, check=True)
+    imported, loaded, yaml_loaded, pygments_loaded = result.stdout.split()
+    modules = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            name = fields[2].rstrip()
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            modules.append((int(fields[1]), depth, name.strip()))
+    return float(imported), float(loaded), yaml_loaded == 'True', pygments_loaded == 'True', modules
+
+
+def main(runs):
+    imports, cold, warm = [], [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            imported, loaded, _, _, _ = run(cache_dir)
+            imports.append(imported)
+            cold.append(loaded)
+            imported, loaded, yaml_loaded, pygments_loaded, modules = run(cache_dir)
+            imports.append(imported)
+            warm.append(loaded)
+
+    print('import quiet_app_launch      %6.1f ms' % (statistics.median(imports) * 1000))
+    print('configs, no snapshot         %6.1f ms' % (statistics.median(cold) * 1000))
+    print('configs, from snapshot       %6.1f ms' % (statistics.median(warm) * 1000))
+    print('yaml imported on warm start:     %s' % yaml_loaded)
+    print('pygments imported at startup:    %s' % pygments_loaded)
+    print('\nslowest imports made by quiet_app_launch (cumulative):')
+    # modules are listed after the imports they triggered, so the
+    # direct imports of quiet_app_launch are the depth 1 lines before it
+    end = max(i for i, (us, depth, name) in enumerate(modules) if name == 'quiet_app_launch')
+    start = max([i for i, (us, depth, name) in enumerate(modules[:end]) if depth == 0] or [-1]) + 1
+    direct = [(us, name) for us, depth, name in modules[start:end] if depth == 1]
+    for us, name in sorted(direct, reverse=True)[:10]:
+        print('  %-30s %6.1f ms' % (name, us / 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
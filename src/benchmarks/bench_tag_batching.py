@@ -0,0 +1,117 @@
+'''Compare Tcl calls needed to tag a document per token vs. batched per tag.
+
+Run from the src directory:
+
+    python -m benchmarks.bench_tag_batching [line_count]
+
+Call counts are measured against a recording stand-in for the text widget.
+When a display is available the same work is also timed on a real
+CustomText widget.'''
+import sys
+import time
+
+from pygments import lex
+from pygments.lexers import get_lexer_by_name
+from quiet_incremental_lexer import IncrementalLexer
+from quiet_spans import SpanAccumulator
+
+SAMPLE = '''class Example(object):
+    """A docstring
+    spanning lines."""
+
+    def method(self, value=42):
+        # a comment
+        result = [x * 2.5 for x in range(value) if x % 3]
+        return "done: %s" % result, 'single', None
+
+'''
+
+
+def make_document(line_count):
+    sample_lines = SAMPLE.count('\n')
+    return SAMPLE * (line_count // sample_lines + 1)
+
+
+class RecordingText:
+    '''Counts the widget calls that would each become a Tcl round-trip.'''
+
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def get(self, start, end):
+        self.calls += 1
+        first = int(start.split('.')[0])
+        last = int(end.split('.')[0])
+        lines = self.content.split('\n')
+        return ''.join(line + '\n' for line in lines[first - 1:last - 1])
+
+    def mark_set(self, name, index):
+        self.calls += 1
+
+    def tag_add(self, tag, *indices):
+        self.calls += 1
+
+    def tag_remove(self, tag, start, end):
+        self.calls += 1
+
+    def tag_add_ranges(self, tag, indices):
+        self.calls += 1
+
+
+# the loop initial_highlight used before spans were batched
+def per_token(text_widget, content, lexer):
+    text_widget.mark_set("range_start", "1.0")
+    for token, value in lex(content, lexer):
+        text_widget.mark_set("range_end", "range_start + %dc" % len(value))
+        text_widget.tag_add(str(token), "range_start", "range_end")
+        text_widget.mark_set("range_start", "range_end")
+
+
+def batched(text_widget, content, lexer):
+    line_count = content.count('\n')
+    incremental = IncrementalLexer(lexer, line_count)
+    first, end, spans = incremental.relex(
+        lambda first, last: (text_widget.get('%d.0' % first, '%d.0' % (last + 1)), 0))
+    for tag in incremental.tags:
+        text_widget.tag_remove(tag, '%d.0' % first, '%d.0' % end)
+    SpanAccumulator(spans).apply(text_widget)
+
+
+def count_calls(line_count):
+    content = make_document(line_count)
+    lexer = get_lexer_by_name('python')
+    for name, highlight in (('per token', per_token), ('batched', batched)):
+        recorder = RecordingText(content)
+        highlight(recorder, content, lexer)
+        print('%-10s %9d widget calls' % (name, recorder.calls))
+
+
+def time_tk(line_count):
+    import tkinter as tk
+    from quiet_textarea import CustomText
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print('no display, skipping Tk timings')
+        return
+
+    content = make_document(line_count)
+    lexer = get_lexer_by_name('python')
+    text_widget = CustomText(root)
+    for name, highlight in (('per token', per_token), ('batched', batched)):
+        text_widget.delete('1.0', 'end')
+        text_widget.insert('1.0', content)
+        start = time.perf_counter()
+        highlight(text_widget, content, lexer)
+        root.update_idletasks()
+        print('%-10s %9.3f s on a real Text widget' % (name, time.perf_counter() - start))
+    root.destroy()
+
+
+if __name__ == '__main__':
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print('%d lines of Python' % line_count)
+    count_calls(line_count)
+    time_tk(line_count)
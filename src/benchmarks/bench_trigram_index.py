@@ -0,0 +1,108 @@
+'''Measure building and querying the trigram index of Find in Folder.
+
+Run from the src directory:
+
+    python -m benchmarks.bench_trigram_index [folder] [query ...]
+
+The folder defaults to the Python standard library. The index goes to a
+temporary cache directory, so the one the editor uses is left alone. It
+is built from scratch, updated with nothing changed and loaded back from
+disk, then every query is searched without the index and with it, and
+the times and the number of files grepped are compared. Matches are
+checked to be the same both ways.'''
+import os
+import sys
+import tempfile
+import time
+
+QUERIES = ['import threading', 'def __init__(self', 'NotImplementedError', r're:class \w+Error\(',
+           'TODO', 'zzz_not_anywhere']
+
+
+class Widget:
+    '''Stands in for the Tk widget FolderSearch polls from.'''
+
+    def __init__(self):
+        self.jobs = []
+
+    def after(self, ms, callback):
+        self.jobs.append(callback)
+        return callback
+
+    def after_cancel(self, job):
+        self.jobs.remove(job)
+
+    def run_until(self, done):
+        while not done:
+            time.sleep(0.005)
+            self.jobs.pop(0)()
+
+
+def search(folder_search, widget, root, pattern):
+    matches = []
+    done = []
+    started = time.perf_counter()
+    folder_search.start(root, pattern, matches.extend, done.append)
+    widget.run_until(done)
+    return time.perf_counter() - started, sorted(matches)
+
+
+def update(folder_search, root):
+    started = time.perf_counter()
+    folder_search.update_index(root)
+    folder_search._index_thread.join()
+    return time.perf_counter() - started
+
+
+def main(root, queries):
+    from quiet_find_engine import compile_pattern
+    from quiet_folder_search import FolderSearch
+    from quiet_trigram_index import TrigramIndex, trigram_index
+
+    widget = Widget()
+    folder_search = FolderSearch(widget)
+    # start the pool before timing anything
+    folder_search.use_index = False
+    search(folder_search, widget, root, compile_pattern('warm up'))
+
+    plain = {}
+    for query in queries:
+        pattern = compile_pattern(query[3:], regex=True) if query.startswith('re:') else compile_pattern(query)
+        seconds, matches = search(folder_search, widget, root, pattern)
+        plain[query] = (pattern, seconds, folder_search.files, matches)
+
+    folder_search.use_index = True
+    built = update(folder_search, root)
+    updated = update(folder_search, root)
+    index = trigram_index(root)
+    started = time.perf_counter()
+    loaded = TrigramIndex(root, index.path)
+    loaded.load()
+    load = time.perf_counter() - started
+
+    print('folder                      %s' % root)
+    print('files indexed               %d' % len(index.files))
+    print('postings                    %d (%.1f MB, bound %.1f MB)' % (
+        index.posting_count, index.size_bytes / (1 << 20), index.max_postings * 4 / (1 << 20)))
+    print('index file                  %.1f MB' % (os.path.getsize(index.path) / (1 << 20)))
+    print('build                       %7.1f ms' % (built * 1000))
+    print('update, nothing changed     %7.1f ms' % (updated * 1000))
+    print('load from disk              %7.1f ms' % (load * 1000))
+    print('\n%-28s %9s %9s %9s %7s %7s' % ('query', 'grep ms', 'index ms', 'select ms', 'files', 'grepped'))
+    for query in queries:
+        pattern, seconds, files, matches = plain[query]
+        started = time.perf_counter()
+        index.select(pattern)
+        select = time.perf_counter() - started
+        indexed, indexed_matches = search(folder_search, widget, root, pattern)
+        print('%-28s %9.1f %9.1f %9.1f %7d %7d%s' % (
+            query[:28], seconds * 1000, indexed * 1000, select * 1000, files, folder_search.files,
+            '' if indexed_matches == matches else '  MISMATCH'))
+    folder_search.shutdown()
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ['XDG_CACHE_HOME'] = cache_dir
+        root = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.__file__))
+        main(root, sys.argv[2:] or QUERIES)
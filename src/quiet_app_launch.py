@@ -1,24 +1,48 @@
 import os
 import sys
 import time
-import yaml
 import tkinter as tk 
 import tkinter.font as tk_font
 import re
 
+from functools import cached_property
 from platform import system
-from tkinter import (filedialog, messagebox, ttk)
-from quiet_syntax_highlighting import SyntaxHighlighting
-from quiet_menubar import Menu, Menubar
+from tkinter import messagebox
 from quiet_statusbar import Statusbar
 from quiet_linenumbers import TextLineNumbers
 from quiet_textarea import CustomText
-from quiet_find import FindWindow
-from quiet_context import ContextMenu
-from quiet_loaders import QuietLoaders
+from quiet_loaders import QuietLoaders, save_config_snapshot
+from quiet_file_loader import FileLoader
+from quiet_large_file import LargeFileView
+from quiet_save import SaveEngine
+from quiet_journal import EditJournal, orphaned_journals, replay
+from quiet_startup_profile import StartupProfile
+
+# settings applied straight to the text area, by widget option
+TEXTAREA_OPTIONS = {
+    'textarea_background_color': 'bg',
+    'font_color': 'fg',
+    'textarea_padding_x': 'padx',
+    'textarea_padding_y': 'pady',
+    'text_top_lineheight': 'spacing1',
+    'text_bottom_lineheight': 'spacing3',
+    'insertion_color': 'insertbackground',
+    'text_selection_bg': 'selectbackground',
+    'text_wrap': 'wrap',
+}
+
+# line comment of each highlighter language, by pygments alias
+COMMENT_PREFIXES = {'python': '#', 'c': '//', 'javascript': '//'}
+# where an indent goes on every line that is not empty
+LINE_STARTS = re.compile(r'^(?=[^\n])', re.MULTILINE)
+
+# settings the menu bar takes its colors from
+MENU_SETTINGS = ('menu_bg', 'menu_fg', 'menu_active_bg', 'menu_active_fg',
+                 'menubar_active_bg', 'menubar_active_fg', 'textarea_background_color')
 
 class QuietText(tk.Frame):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, startup_profile=None, **kwargs):
+        profile = startup_profile or StartupProfile()
         tk.Frame.__init__(self, *args, **kwargs)
         master.title('untitled - Quiet Text')
         # defined size of the editer window
@@ -79,6 +103,7 @@ class QuietText(tk.Frame):
         #configuration of the file dialog text colors.
 
         self.italics = tk_font.Font(family=self.font_family, slant='italic')
+        profile.mark('settings and theme')
         self.master = master
         self.filename = None
                                 
@@ -124,19 +149,38 @@ class QuietText(tk.Frame):
                                 padx=self.padding_x,
                                 pady=self.padding_y)
 
-        self.initial_content = self.textarea.get("1.0", tk.END)
-
         #retrieving the font from the text area and setting a tab width
         self._font = tk_font.Font(font=self.textarea['font'])
         self._tab_width = self._font.measure(' ' * self.tab_size_spaces)
         self.textarea.config(tabs=(self._tab_width,))
+        profile.mark('text area')
 
         self.menu_hidden = False
-        self.context_menu = ContextMenu(self)
+        self.startup_profile = profile
         self.statusbar = Statusbar(self)
         self.linenumbers = TextLineNumbers(self)
-        self.syntax_highlighter = SyntaxHighlighting(self, self.textarea, self.initial_content)
-        self.menubar = Menubar(self)
+        self.file_loader = FileLoader(self)
+        # line to jump to once the file being loaded is in
+        self.goto_after_load = None
+        self.find_folder_window = None
+        # whether highlighting waits for a file to stream in, kept here
+        # until the highlighter is built
+        self.highlighting_paused = False
+        self.large_file = LargeFileView(self)
+        self.save_engine = SaveEngine(self.textarea)
+        self.last_save_error = None
+        self.journal = EditJournal(self.textarea)
+        try:
+            self.journal.checkpoint()
+            self.textarea.journal = self.journal
+        except OSError as e:
+            print(e)
+        # files bigger than this open in the read-only large file view
+        self.large_file_threshold = self.settings.get('large_file_threshold_mb', 256) * 1024 * 1024
+        profile.mark('editor components')
+        # writes to settings.yaml are debounced from here on
+        self.loader.settings.attach(self.textarea)
+        self.loader.settings.subscribe(self._on_settings_changed)
 
         self.linenumbers.attach(self.textarea)
         self.scrolly.pack(side=tk.RIGHT, fill=tk.Y)
@@ -145,15 +189,73 @@ class QuietText(tk.Frame):
         self.textarea.pack(side=tk.RIGHT, fill='both', expand=True)
         
         self.textarea.tag_configure('find_match', background='#75715e')
-        self.textarea.find_match_index = None
-        self.textarea.find_search_starting_index = 1.0
+        self.textarea.tag_configure('find_current', background='#a6a08a')
 
         self.tags_configured = False
         #calling function to bind hotkeys.
         self.bind_shortcuts()
         self.control_key = False
+        # the highlighter and menus wait until the text area is on screen
+        self._first_expose = self.textarea.bind('<Expose>', self._on_first_expose, add='+')
+        profile.mark('layout and bindings')
+
+    # the highlighter, menus and right click menu are built on first use;
+    # the first two are also built as soon as the first frame is drawn
+    @cached_property
+    def syntax_highlighter(self):
+        from quiet_syntax_highlighting import SyntaxHighlighting
+        highlighter = SyntaxHighlighting(self, self.textarea)
+        highlighter.paused = self.highlighting_paused
+        self.textarea.subscribe(highlighter.on_text_change)
+        if len(self.textarea.document) and not highlighter.paused:
+            highlighter.initial_highlight()
+        return highlighter
+
+    # whether the highlighter exists yet; view changes and file loads
+    # during startup leave it for _build_deferred_ui to build
+    @property
+    def highlighter_built(self):
+        return 'syntax_highlighter' in self.__dict__
+
+    def pause_highlighting(self, paused):
+        self.highlighting_paused = paused
+        if self.highlighter_built:
+            self.syntax_highlighter.paused = paused
+
+    # highlight the buffer from scratch; a highlighter built later does
+    # that by itself
+    def rehighlight(self):
+        if self.highlighter_built:
+            self.syntax_highlighter.initial_highlight()
+
+    @cached_property
+    def menubar(self):
+        from quiet_menubar import Menubar
+        return Menubar(self)
+
+    @cached_property
+    def context_menu(self):
+        from quiet_context import ContextMenu
+        return ContextMenu(self)
+
+    def _on_first_expose(self, event):
+        self.textarea.unbind('<Expose>', self._first_expose)
+        # idle callbacks queued from here run after Tk has drawn the frame
+        self.after_idle(self._build_deferred_ui)
+
+    def _build_deferred_ui(self):
+        profile = self.startup_profile
+        profile.mark('first frame', counted=False)
+        self.syntax_highlighter
+        self.menubar
+        # configs parsed during startup are read from the snapshot next time
+        save_config_snapshot()
+        profile.mark('highlighter and menus', counted=False)
+        profile.report()
 
     def clear_and_replace_textarea(self):
+            # settings.yaml may still have a write pending
+            self.loader.settings.flush()
             self.textarea.delete(1.0, tk.END)
             try:
                 with open(self.filename, 'r') as f:
@@ -174,62 +276,58 @@ class QuietText(tk.Frame):
     # editor basic settings can be altered here
     #function used to reload settings after the user changes in settings.yaml
     def reconfigure_settings(self, overwrite_with_default=False):
-            if overwrite_with_default:
-                _settings = self.loader.load_settings_data(default=True)
+            if not overwrite_with_default:
+                # settings.yaml was saved from the editor; the store notices
+                # and _on_settings_changed applies whatever differs
+                self.loader.settings.reload()
+                return
+
+            _settings = self.loader.load_settings_data(default=True)
+            self.apply_settings(_settings)
+            MsgBox = tk.messagebox.askquestion('Reset Settings?',
+                                               'Are you sure you want to reset the editor settings to their default value?',
+                                                icon='warning')
+            if MsgBox == 'yes':
+                self.loader.store_settings_data(_settings)
             else:
-                _settings = self.loader.load_settings_data()
-            font_family = _settings['font_family']
-            bg_color = _settings['textarea_background_color']
-            font_color = _settings['font_color']
-            top_spacing = _settings['text_top_lineheight']
-            bottom_spacing = _settings['text_bottom_lineheight']
-            insertion_blink = 300 if _settings['insertion_blink'] else 0
-            insertion_color = _settings['insertion_color']
-            tab_size_spaces = _settings['tab_size']
-            padding_x = _settings['textarea_padding_x']
-            padding_y = _settings['textarea_padding_y']
-            text_wrap = _settings['text_wrap']
-            border = _settings['textarea_border']
-            text_selection_bg = _settings['text_selection_bg']
-            scrollx_clr = _settings['horizontal_scrollbar_color']
-            troughx_clr = _settings['horizontal_scrollbar_trough_color']
-            scrollx_width = _settings['horizontal_scrollbar_width']
-            scrollx_active_bg = _settings['horizontal_scrollbar_active_bg']
-            menu_fg = _settings['menu_fg']
-            menu_bg = _settings['menu_bg']
-
-            font_style = tk_font.Font(family=font_family,
-                                      size=_settings['font_size'])
-
-            self.textarea.configure(font=font_style,
-                                    bg=bg_color,
-                                    pady=padding_y,
-                                    padx=padding_x,
-                                    fg=font_color,
-                                    spacing1=top_spacing,
-                                    spacing3=bottom_spacing,
-                                    insertbackground=insertion_color,
-                                    selectbackground= text_selection_bg,
-                                    insertofftime=insertion_blink,
-                                    bd=border,
-                                    highlightthickness=border,
-                                    wrap=text_wrap)
-
-            self.set_new_tab_width(tab_size_spaces)
-            self.menubar.reconfigure_settings()
-            self.linenumbers.font_color = menu_fg
-            self.linenumbers.config(bg=bg_color, highlightbackground=bg_color)
-            self.statusbar._label.config(bg=bg_color)
-            self.linenumbers.redraw()
-
-            if overwrite_with_default:
-                MsgBox = tk.messagebox.askquestion('Reset Settings?',
-                                                   'Are you sure you want to reset the editor settings to their default value?',
-                                                    icon='warning')
-                if MsgBox == 'yes':
-                    self.loader.store_settings_data(_settings)
-                else:
-                    self.save('config/settings.yaml')
+                self.save('config/settings.yaml')
+
+    def _on_settings_changed(self, changed):
+        self.apply_settings(self.loader.load_settings_data(), changed)
+
+    # configure the widgets depending on the changed settings keys, or on
+    # all of them when changed is None
+    def apply_settings(self, _settings, changed=None):
+            def affected(*keys):
+                return changed is None or not changed.isdisjoint(keys)
+
+            options = {option: _settings[key]
+                       for key, option in TEXTAREA_OPTIONS.items()
+                       if affected(key)}
+            if affected('insertion_blink'):
+                options['insertofftime'] = 300 if _settings['insertion_blink'] else 0
+            if affected('textarea_border'):
+                options['bd'] = options['highlightthickness'] = _settings['textarea_border']
+            font = (_settings['font_family'], int(_settings['font_size']))
+            # change_font_size configures the font itself before storing it
+            if affected('font_family', 'font_size') and (changed is None or font != (self.font_family, self.font_size)):
+                self.font_family, self.font_size = font
+                options['font'] = tk_font.Font(family=self.font_family,
+                                               size=self.font_size)
+            if options:
+                self.textarea.configure(**options)
+
+            if 'font' in options or affected('tab_size'):
+                self.tab_size_spaces = _settings['tab_size']
+                self.set_new_tab_width()
+            if affected(*MENU_SETTINGS):
+                self.menubar.reconfigure_settings()
+            if affected('menu_fg', 'textarea_background_color'):
+                bg_color = _settings['textarea_background_color']
+                self.linenumbers.font_color = _settings['menu_fg']
+                self.linenumbers.config(bg=bg_color, highlightbackground=bg_color)
+                self.statusbar._label.config(bg=bg_color)
+                self.linenumbers.redraw()
 
     # editor quiet mode calling which removes status bar and menu bar
     def enter_quiet_mode(self, *args):
@@ -266,13 +364,18 @@ class QuietText(tk.Frame):
     # new file creating in the editor feature
     #Deletes all of the text in the current area and sets window title to default.
     def new_file(self, *args):
+        self.file_loader.cancel()
+        self.large_file.close()
+        self.pause_highlighting(False)
         self.textarea.delete(1.0, tk.END)
         self.filename = None
         self.set_window_title()
+        self.checkpoint_journal()
 
     # opening an existing file in the editor
     def open_file(self, *args):
         # various file types that editor can support
+        from tkinter import filedialog
         self.filename = filedialog.askopenfilename(
             defaultextension='.txt',
             filetypes=[('All Files', '*.*'),
@@ -284,9 +387,8 @@ class QuietText(tk.Frame):
                        ('CSS Documents', '*.css')])
 
         if self.filename:
-            self.clear_and_replace_textarea()
             self.set_window_title(name=self.filename)
-            self.syntax_highlighter.initial_highlight()
+            self.load_file(self.filename)
 
     # opening an existing file without TK filedialog
     def open_file_without_dialog(self, path):
@@ -299,27 +401,85 @@ class QuietText(tk.Frame):
             return
 
         self.filename = path
-        self.clear_and_replace_textarea()
-        self.syntax_highlighter.initial_highlight()
+        self.set_window_title(name=self.filename)
+        self.load_file(self.filename)
+
+    # open a file with the cursor on a line, as soon as it has loaded
+    def open_file_at(self, path, line):
+        self.goto_after_load = line
+        self.open_file_without_dialog(path)
+        if not self.file_loader.loading:
+            # loaded already, opened as a large file or not opened at all
+            self.goto_after_load = None
+            if self.large_file.active:
+                self.large_file.goto(line)
+
+    # stream a file into the text area, highlighting once it is all there
+    def load_file(self, path):
+        self.pause_highlighting(True)
+        self.journal.paused = True
+        self.large_file.close()
+        if os.path.getsize(path) > self.large_file_threshold:
+            self.file_loader.cancel()
+            try:
+                self.large_file.open(path)
+            except (OSError, ValueError):
+                # cannot be mapped; stream it in like any other file
+                pass
+            else:
+                self.statusbar.display_status_message('Large file: opened read-only.', msg_type='hint')
+                return
+        self.file_loader.open(path, self._file_loaded)
+
+    def _file_loaded(self, completed):
+        self.pause_highlighting(False)
+        if not completed:
+            # a partial buffer must not be saved over the file
+            self.filename = None
+            self.set_window_title()
+        self.checkpoint_journal(on_disk=completed)
+        line, self.goto_after_load = self.goto_after_load, None
+        if line is not None and completed:
+            self.textarea.mark_set(tk.INSERT, '%d.0' % line)
+            self.textarea.see(tk.INSERT)
+        self.rehighlight()
+
+    def cancel_file_loading(self, *args):
+        self.file_loader.cancel()
 
     # saving changes made in the file
     def save(self,*args):
+        if self.large_file.active:
+            self.statusbar.display_status_message('Large files are opened read-only.')
+            return
         if self.filename:
-            try:
-                textarea_content = self.textarea.get(1.0, tk.END)
-                with open(self.filename, 'w') as f:
-                    f.write(textarea_content)
-                self.statusbar.update_status('saved')
-                if self.filename == 'config/settings.yaml':
-                    self.reconfigure_settings()
-                    self.menubar.reconfigure_settings()
-            except Exception as e:
-                print(e)
+            self.start_save(self.filename)
         else:
             self.save_as()
 
+    def start_save(self, path):
+        revision = self.textarea.revision
+        self.save_engine.save(path, lambda path, error: self._on_saved(path, error, revision))
+
+    # called on the Tk thread once a background save has finished
+    def _on_saved(self, path, error, revision):
+        self.last_save_error = error
+        if error is not None:
+            self.statusbar.display_status_message('Unable to save %s: %s' % (os.path.basename(path), error))
+            return
+        if revision == self.textarea.revision and path == self.filename:
+            # the file now holds the buffer, so the journal can start from it
+            self.checkpoint_journal(on_disk=True, saved=True)
+        self.statusbar.update_status('saved')
+        if path == 'config/settings.yaml':
+            self.reconfigure_settings()
+
     # saving file as a particular name
     def save_as(self, *args):
+        if self.large_file.active:
+            self.statusbar.display_status_message('Large files are opened read-only.')
+            return
+        from tkinter import filedialog
         try:
             new_file = filedialog.asksaveasfilename(
                 initialfile='untitled.txt',
@@ -332,12 +492,11 @@ class QuietText(tk.Frame):
                            ('HTML Documents', '*.js'),
                            ('CSS Documents', '*.css')])
 
-            textarea_content = self.textarea.get(1.0, tk.END)
-            with open(new_file, 'w') as f:
-                f.write(textarea_content)
+            if not new_file:
+                return
             self.filename = new_file
             self.set_window_title(self.filename)
-            self.statusbar.update_status('saved')
+            self.start_save(new_file)
         except Exception as e:
             print(e)
             
@@ -348,6 +507,8 @@ class QuietText(tk.Frame):
             self.save()          
         except:
             self.save_as()
+        self.save_engine.flush()
+        self.journal.close(remove=self.last_save_error is None)
         quit()
                         
 
@@ -356,6 +517,8 @@ class QuietText(tk.Frame):
         if message == True:
             self.quit_save()
         elif message == False:
+            self.save_engine.flush()
+            self.journal.close(remove=True)
             quit()
         else:
             return
@@ -374,12 +537,61 @@ class QuietText(tk.Frame):
         except TypeError:
             self.statusbar.update_status('no file run')
 
+    # restart the crash journal from the current buffer, or from the file
+    # it was just loaded from or saved to
+    def checkpoint_journal(self, on_disk=False, saved=False):
+        if self.textarea.journal is None:
+            return
+        try:
+            if on_disk and self.filename:
+                self.journal.checkpoint_file(self.filename, strip_newline=saved)
+            else:
+                self.journal.checkpoint(self.filename)
+        except OSError as e:
+            print(e)
+
+    # offer to restore the buffer of an editor that did not exit cleanly,
+    # newest first. A journal is removed once it is restored, turned down
+    # or found to hold nothing new; the ones left after a restore are
+    # offered the next time the editor starts
+    def recover_session(self):
+        for path in orphaned_journals(self.journal.directory):
+            try:
+                recovered = replay(path)
+            except OSError:
+                continue
+            if recovered is None or not _differs_from_disk(*recovered):
+                _remove_journal(path)
+                continue
+
+            filename, text = recovered
+            name = os.path.basename(filename) if filename else 'an untitled file'
+            answer = messagebox.askyesno('Recover Unsaved Work?',
+                                         f'QuietText did not close cleanly while editing {name}. '
+                                         'Restore the unsaved changes?')
+            _remove_journal(path)
+            if not answer:
+                continue
+
+            self.filename = filename
+            self.textarea.delete(1.0, tk.END)
+            self.textarea.insert(1.0, text)
+            self.set_window_title(name=filename)
+            self.checkpoint_journal()
+            self.rehighlight()
+            return True
+        return False
+
     # opens the main setting file of the editor
     def open_settings_file(self):
+        self.large_file.close()
+        self.pause_highlighting(False)
         self.filename = 'config/settings.yaml'
+        self.journal.paused = True
         self.textarea.delete(1.0, tk.END)
         with open(self.filename, 'r') as f:
             self.textarea.insert(1.0, f.read())
+        self.checkpoint_journal(on_disk=True)
         self.syntax_highlighter.initial_highlight()
         self.set_window_title(name=self.filename)
 
@@ -389,6 +601,19 @@ class QuietText(tk.Frame):
         self.clear_and_replace_textarea()
         self.syntax_highlighter.initial_highlight()
 
+    # jump to a line, in file lines when a large file is open
+    def go_to_line(self, *args):
+        from tkinter import simpledialog
+        line = simpledialog.askinteger('Go to Line', 'Line number:', parent=self.master, minvalue=1)
+        if line is None:
+            return 'break'
+        if self.large_file.active:
+            self.large_file.goto(line)
+        else:
+            self.textarea.mark_set(tk.INSERT, '%d.0' % line)
+            self.textarea.see(tk.INSERT)
+        return 'break'
+
     # select all written text in the editor
     def select_all_text(self, *args):
         self.textarea.tag_add(tk.SEL, '1.0', tk.END)
@@ -409,6 +634,8 @@ class QuietText(tk.Frame):
 
     def _on_change(self, key_event):
         self.linenumbers.redraw()
+        if self.highlighter_built:
+            self.syntax_highlighter.on_view_change()
 
     def _on_mousewheel(self, event):
         if self.control_key:
@@ -465,13 +692,37 @@ class QuietText(tk.Frame):
         self.syntax_highlighter.default_highlight()
         if not self.tags_configured:
             self.syntax_highlighter.syntax_theme_configuration()
+            self.tags_configured = True
         self.control_key = False
         self.textarea.isControlPressed = False
 
     def show_find_window(self, event=None):
-        FindWindow(self.textarea)
+        from quiet_find import FindWindow
+        FindWindow(self.textarea, statusbar=self.statusbar)
+        self.control_key = False
+        self.textarea.isControlPressed = False
+
+    # Ctrl+P: open a file of the working directory by part of its path
+    def show_quick_open(self, event=None):
+        from quiet_quick_open import QuickOpenWindow
+        QuickOpenWindow(self.textarea, self)
+        self.control_key = False
+        self.textarea.isControlPressed = False
+        return 'break'
+
+    # one window, which keeps its results until it is closed
+    def show_find_folder_window(self, event=None):
+        from quiet_find_folder import FindFolderWindow
+        window = self.find_folder_window
+        if window is not None and window.winfo_exists():
+            window.deiconify()
+            window.lift()
+            window.find_entry.focus_force()
+        else:
+            self.find_folder_window = FindFolderWindow(self.textarea, self)
         self.control_key = False
         self.textarea.isControlPressed = False
+        return 'break'
 
     def select_all(self):
         self.selection_set(0, 'end')
@@ -551,16 +802,62 @@ class QuietText(tk.Frame):
             self.menubar.hide_menu()
         self.menu_hidden = not self.menu_hidden
 
+    # first and last line of a selection across lines, leaving out a last
+    # line it only reaches the start of; None for any other selection
+    def selected_lines(self):
+        ranges = self.textarea.tag_ranges(tk.SEL)
+        if not ranges:
+            return None
+        first = int(str(ranges[0]).split('.')[0])
+        last, col = map(int, str(ranges[-1]).split('.'))
+        if last == first:
+            return None
+        if col == 0:
+            last -= 1
+        return first, last
+
+    # rewrite the selected lines, or the cursor's line, in one edit and
+    # keep whole lines selected
+    def edit_lines(self, transform):
+        lines = self.selected_lines()
+        if lines is None:
+            line = int(self.textarea.index(tk.INSERT).split('.')[0])
+            self.textarea.replace_lines(line, line, transform)
+            return
+        first, last = lines
+        if self.textarea.replace_lines(first, last, transform):
+            self.textarea.tag_add(tk.SEL, '%d.0' % first, '%d.0 lineend' % last)
+
+    # indents the selected lines, or inserts a tab
     def tab_text(self, event):
-        index = self.textarea.index("sel.first linestart")
-        last = self.textarea.index("sel.last linestart")
-        if last != index:
-            while self.textarea.compare(index,"<=", last):
-                self.textarea.insert(index, '\t')
-                index = self.textarea.index("%s + 1 line" % index)
+        if self.selected_lines() is None:
+            self.textarea.insert(tk.INSERT, '\t')
         else:
-            index = self.textarea.index(tk.INSERT)
-            self.textarea.insert(index, '\t')
+            self.edit_lines(lambda text: LINE_STARTS.sub('\t', text))
+        return "break"
+
+    # takes a tab, or up to a tab's worth of spaces, off every line
+    def untab_text(self, event):
+        indent = re.compile(r'^(?:\t| {1,%d})' % self.tab_size_spaces, re.MULTILINE)
+        self.edit_lines(lambda text: indent.sub('', text))
+        return "break"
+
+    # comments the lines out at their common indent, or uncomments them
+    # if every line that is not blank is a comment already
+    def toggle_comment(self, event=None):
+        prefix = COMMENT_PREFIXES.get(self.syntax_highlighter.lexer.aliases[0], '#')
+        escaped = re.escape(prefix)
+
+        def toggle(text):
+            indents = re.findall(r'^([ \t]*)\S', text, re.MULTILINE)
+            if not indents:
+                return text
+            if not re.search(r'^[ \t]*(?!%s)\S' % escaped, text, re.MULTILINE):
+                return re.sub(r'^([ \t]*)%s ?' % escaped, r'\1', text, flags=re.MULTILINE)
+            indent = min(map(len, indents))
+            return re.sub(r'^([ \t]{%d})(?=[ \t]*\S)' % indent, r'\g<1>%s ' % prefix, text, flags=re.MULTILINE)
+
+        self.edit_lines(toggle)
         return "break"
 
 
@@ -568,29 +865,34 @@ class QuietText(tk.Frame):
         text = self.textarea
         text.bind('<Control-n>', self.new_file)
         text.bind('<Control-o>', self.open_file)
+        text.bind('<Control-p>', self.show_quick_open)
         text.bind('<Control-s>', self.save)
         text.bind('<Control-S>', self.save_as)
-        text.bind('<Control-b>', self.context_menu.bold)
-        text.bind('<Control-h>', self.context_menu.hightlight)
+        text.bind('<Control-b>', lambda event: self.context_menu.bold(event))
+        text.bind('<Control-h>', lambda event: self.context_menu.hightlight(event))
         text.bind('<Control-a>', self.select_all_text)
         text.bind('<Control-m>', self.apply_hex_color)
         text.bind('<Control-r>', self.run)
         text.bind('<Control-q>', self.enter_quiet_mode)
         text.bind('<Control-f>', self.show_find_window)
+        text.bind('<Control-F>', self.show_find_folder_window)
+        text.bind('<Control-g>', self.go_to_line)
         text.bind('<Control-z>', self.textarea.edit_undo())
         text.bind('<Control-Shift-z', self.textarea.edit_redo())
         text.bind('<Escape>', self.leave_quiet_mode)
-        text.bind('<<Change>>', self._on_change)
+        text.bind('<Escape>', self.cancel_file_loading, add='+')
         text.bind('<Configure>', self._on_change)
-        text.bind('<Button-3>', self.context_menu.popup)
+        self.textarea.subscribe(self.linenumbers.redraw)
+        self.textarea.subscribe(self.statusbar.on_text_change)
+        text.bind('<Button-3>', lambda event: self.context_menu.popup(event))
         text.bind('<MouseWheel>', self._on_mousewheel)
         text.bind('<Button-4>', self._on_linux_scroll_up)
         text.bind('<Button-5>', self._on_linux_scroll_down)
         text.bind('<Key>', self._on_keydown)
         text.bind('<KeyRelease>', self.syntax_highlight)
-        text.bind_all('<<Paste>>', self.context_menu.paste)
-        text.bind('<Shift-asciitilde>', self.syntax_highlighter.initial_highlight)
-        text.bind('<Control-Shift-KeyRelease>', self.syntax_highlighter.initial_highlight)
+        text.bind_all('<<Paste>>', lambda event: self.context_menu.paste(event))
+        text.bind('<Shift-asciitilde>', lambda event: self.syntax_highlighter.initial_highlight())
+        text.bind('<Control-Shift-KeyRelease>', lambda event: self.syntax_highlighter.initial_highlight())
         text.bind('<Shift-parenleft>', self.autoclose_parentheses)
         text.bind('<bracketleft>', self.autoclose_square_brackets)
         text.bind('<quoteright>', self.autoclose_single_quotes)
@@ -602,6 +904,28 @@ class QuietText(tk.Frame):
         text.bind('<Alt_L>', self.hide_and_unhide_menubar)
         text.bind('<Control-L>', self.toggle_linenumbers)
         text.bind('<KeyPress-Tab>', self.tab_text)
+        # X11 reports Shift+Tab as its own key
+        text.bind('<ISO_Left_Tab>' if system() == 'Linux' else '<Shift-Tab>', self.untab_text)
+        text.bind('<Control-slash>', self.toggle_comment)
+
+
+def _remove_journal(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# whether recovered text holds anything the file on disk does not
+def _differs_from_disk(filename, text):
+    if not filename:
+        return bool(text)
+    try:
+        with open(filename, 'r') as f:
+            saved = f.read()
+    except (OSError, UnicodeDecodeError):
+        return True
+    return saved not in (text, text + '\n')
 
 
 if __name__ == '__main__':
@@ -611,10 +935,14 @@ if __name__ == '__main__':
         master.iconphoto(False, p1)
     except Exception as e:
         print(e)
-    qt = QuietText(master)
+    # --startup-profile prints the time taken by each phase of starting up
+    profile = StartupProfile(enabled='--startup-profile' in sys.argv)
+    args = [arg for arg in sys.argv[1:] if arg != '--startup-profile']
+    qt = QuietText(master, startup_profile=profile)
     qt.pack(side='top', fill='both', expand=True)
-    if len(sys.argv) > 1:
-        qt.open_file_without_dialog(sys.argv[-1])
+    if not qt.recover_session() and args:
+        qt.open_file_without_dialog(args[-1])
+    profile.mark('open file')
     master.protocol("WM_DELETE_WINDOW", qt.on_closing)
     master.mainloop()
 
@@ -0,0 +1,241 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from tkinter import TclVersion
+
+# not imported from quiet_incremental_lexer, which would load pygments at startup
+NEWLINE = re.compile('\n')
+# characters above the BMP, such as emoji; Tcl before 9 keeps text as
+# UTF-16, so Tk counts each of them as two columns
+ASTRAL = re.compile('[\U00010000-\U0010ffff]')
+ASTRAL_COLUMNS = 2 if TclVersion < 9 else 1
+
+
+def columns(text):
+    '''How many Tk columns text takes up.'''
+    if ASTRAL_COLUMNS == 1 or text.isascii():
+        return len(text)
+    return len(text) + len(ASTRAL.findall(text))
+
+
+class _Buffer:
+    '''Immutable text a piece points into, with its newline positions and
+    whether it holds any character Tk counts as two columns.'''
+
+    __slots__ = ('text', 'newlines', 'astral')
+
+    def __init__(self, text):
+        self.text = text
+        self.newlines = array('l', [m.start() for m in NEWLINE.finditer(text)])
+        self.astral = ASTRAL_COLUMNS > 1 and ASTRAL.search(text) is not None
+
+
+class Document:
+    '''Piece table mirroring the contents of a CustomText.
+
+    The text is a list of (buffer, start, end) pieces over immutable
+    buffers, so an edit only splits pieces and snapshot() is a copy of
+    the piece list. Cumulative offsets and line counts per piece are
+    rebuilt lazily after edits; with each buffer's newline positions
+    that makes converting between offsets and (line, col) a pair of
+    binary searches.
+
+    Lines and columns follow Tk: lines from 1, columns from 0 and counted
+    the way Tk counts them, and the document never includes the text
+    widget's final newline. Offsets count characters.'''
+
+    # typing appends to the last buffer while it is shorter than this,
+    # instead of adding a piece per key
+    merge_limit = 4096
+
+    def __init__(self, text=''):
+        self.reset(text)
+
+    def reset(self, text=''):
+        self._pieces = [(_Buffer(text), 0, len(text))] if text else []
+        self._length = len(text)
+        self._starts = None
+        self._lines = None
+        self._astral = None
+
+    def snapshot(self):
+        '''Copy that later edits to this document do not affect.'''
+        other = Document.__new__(Document)
+        other._pieces = list(self._pieces)
+        other._length = self._length
+        other._starts = self._starts
+        other._lines = self._lines
+        other._astral = self._astral
+        return other
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def line_count(self):
+        self._index()
+        return self._lines[-1] + 1
+
+    # whether Tk columns and character counts can differ anywhere
+    @property
+    def astral(self):
+        self._index()
+        return self._astral
+
+    def text(self):
+        return ''.join(self.chunks())
+
+    def chunks(self, start=0, end=None):
+        '''Yield the text between two offsets piece by piece, without
+        joining it.'''
+        end = self._length if end is None else min(end, self._length)
+        if start >= end:
+            return
+        self._index()
+        i = bisect_right(self._starts, start) - 1
+        while start < end:
+            buffer, piece_start, piece_end = self._pieces[i]
+            offset = self._starts[i]
+            yield buffer.text[piece_start + start - offset:
+                              piece_start + min(end - offset, piece_end - piece_start)]
+            start = offset + piece_end - piece_start
+            i += 1
+
+    def slice(self, start, end):
+        return ''.join(self.chunks(start, end))
+
+    # the same text as Text.get('first.0', 'last+1.0')
+    def get_lines(self, first, last):
+        text = self.slice(self.offset(first, 0), self.offset(last + 1, 0))
+        if last >= self.line_count:
+            # past the last line Tk includes its final newline
+            text += '\n'
+        return text
+
+    def offset(self, line, col):
+        '''Offset of (line, col), clamped to the line and the document.'''
+        line = max(line, 1)
+        start = self._line_start(line)
+        if col <= 0:
+            return start
+        end = self._line_start(line + 1)
+        if line < self.line_count:
+            # before the newline
+            end -= 1
+        if self._astral:
+            col = self._characters(start, end, col)
+        return min(start + col, end)
+
+    def position(self, offset):
+        '''(line, col) of an offset.'''
+        line, col = self._position(offset)
+        if col and self.astral:
+            col = columns(self.slice(offset - col, offset))
+        return line, col
+
+    # offset of the start of line, clamped to the document
+    def _line_start(self, line):
+        wanted = line - 1
+        self._index()
+        if wanted <= 0:
+            return 0
+        lines = self._lines
+        if wanted > lines[-1]:
+            return self._length
+        i = bisect_left(lines, wanted) - 1
+        buffer, start, end = self._pieces[i]
+        newline = buffer.newlines[bisect_left(buffer.newlines, start) + wanted - lines[i] - 1]
+        return self._starts[i] + newline - start + 1
+
+    # how many characters from start on take up col Tk columns
+    def _characters(self, start, end, col):
+        text = self.slice(start, min(start + col, end))
+        if not ASTRAL.search(text):
+            return col
+        width = 0
+        for i, char in enumerate(text):
+            if width >= col:
+                return i
+            width += ASTRAL_COLUMNS if char > '\uffff' else 1
+        return len(text)
+
+    # (line, col) of an offset, with col counting characters
+    def _position(self, offset):
+        offset = min(max(offset, 0), self._length)
+        if not self._pieces:
+            return 1, 0
+        self._index()
+        i = min(bisect_right(self._starts, offset) - 1, len(self._pieces) - 1)
+        buffer, start, end = self._pieces[i]
+        local = start + offset - self._starts[i]
+        newlines = buffer.newlines
+        before = bisect_left(newlines, local)
+        line = self._lines[i] + before - bisect_left(newlines, start) + 1
+        if before and newlines[before - 1] >= start:
+            return line, local - newlines[before - 1] - 1
+        return line, offset - self._line_start(line)
+
+    def insert(self, position, text):
+        if not text:
+            return
+        offset = self.offset(*position)
+        i = self._split(offset)
+        pieces = self._pieces
+
+        previous = pieces[i - 1] if i else None
+        if (previous is not None and previous[2] == len(previous[0].text)
+                and previous[1] == 0 and previous[2] + len(text) <= self.merge_limit):
+            # the previous piece is a whole small buffer: grow it
+            buffer = _Buffer(previous[0].text + text)
+            pieces[i - 1] = (buffer, 0, len(buffer.text))
+        else:
+            buffer = _Buffer(text)
+            pieces.insert(i, (buffer, 0, len(text)))
+        self._length += len(text)
+        self._starts = self._lines = None
+
+    def delete(self, start, end):
+        start = self.offset(*start)
+        end = self.offset(*end)
+        if end <= start:
+            return
+        i = self._split(start)
+        j = self._split(end)
+        del self._pieces[i:j]
+        self._length -= end - start
+        self._starts = self._lines = None
+
+    # make offset fall on a piece boundary and return the index of the
+    # piece starting there
+    def _split(self, offset):
+        self._index()
+        starts = self._starts
+        i = bisect_left(starts, offset)
+        if i < len(starts) and starts[i] == offset:
+            return i
+        if i == len(self._pieces) and offset >= self._length:
+            return i
+        i -= 1
+        buffer, start, end = self._pieces[i]
+        middle = start + offset - starts[i]
+        self._pieces[i:i + 1] = [(buffer, start, middle), (buffer, middle, end)]
+        self._starts = self._lines = None
+        return i + 1
+
+    # cumulative offsets and newline counts at the start of each piece,
+    # with the totals appended
+    def _index(self):
+        if self._starts is not None:
+            return
+        starts = [0]
+        lines = [0]
+        offset = newlines = 0
+        for buffer, start, end in self._pieces:
+            offset += end - start
+            positions = buffer.newlines
+            newlines += bisect_left(positions, end) - bisect_left(positions, start)
+            starts.append(offset)
+            lines.append(newlines)
+        self._starts = starts
+        self._lines = lines
+        self._astral = any(buffer.astral for buffer, start, end in self._pieces)
@@ -0,0 +1,328 @@
+from bisect import bisect_right
+from collections import defaultdict
+from itertools import accumulate
+import heapq
+import os
+import re
+import threading
+import time
+
+from quiet_folder_search import IGNORED_DIRS, IgnoreRules, ignored
+
+# where a word starts in a path, after one of these
+SEPARATORS = frozenset('/\\_-. ')
+
+
+class FuzzyMatcher:
+    '''Ranks paths against a fuzzy query, where the query's characters must
+    appear in the path in order.
+
+    Paths are kept in a rank order, shortest first, and their lowercased
+    forms are joined into one text, a path a line, so finding the paths
+    that match a pattern is a regex scan in C that meets them in rank
+    order. The distinct file names get a text of their own, '/name' a
+    line, in the rank order of their first path, with the paths of every
+    name in named; a query in a file name is looked for there.'''
+
+    def __init__(self, paths):
+        # two stable sorts are quicker than one on (length, path)
+        self.paths = sorted(paths)
+        self.paths.sort(key=len)
+        # a newline in a file name would split its line
+        lower = [path.lower().replace('\n', ' ') for path in self.paths]
+        self.text = ''.join(path + '\n' for path in lower)
+        self.starts = [0]
+        self.starts.extend(accumulate(len(path) + 1 for path in lower))
+        named = defaultdict(list)
+        for i, name in enumerate([path.rpartition('/')[2] for path in lower]):
+            named[name].append(i)
+        self.names = ''.join('/%s\n' % name for name in named)
+        self.name_starts = [0]
+        self.name_starts.extend(accumulate(len(name) + 2 for name in named))
+        self.named = list(named.values())
+
+    def length(self, index):
+        return self.starts[index + 1] - self.starts[index] - 1
+
+    def lower(self, index):
+        return self.text[self.starts[index]:self.starts[index + 1] - 1]
+
+
+def score(path, base, query):
+    '''How well a lowercased path matches a lowercased query, or None when
+    the query's characters are not all in it in order. The query in one
+    piece in the file name beats it in one piece elsewhere, which beats
+    it scattered; then word starts, the file name and short paths win.'''
+    length = len(path)
+    start = path.find(query, base)
+    if start >= 0:
+        return 3000 - length + (200 if start == base else 0)
+    start = path.find(query)
+    if start >= 0:
+        return 2000 - length + (50 if start == 0 or path[start - 1] in SEPARATORS else 0)
+    # matched from the end, so as much of the query as can lands in the
+    # file name
+    total = 1000 - length
+    end = length
+    for char in reversed(query):
+        position = path.rfind(char, 0, end)
+        if position < 0:
+            return None
+        if position >= base:
+            total += 10
+        if position == 0 or path[position - 1] in SEPARATORS:
+            total += 15
+        elif position + 1 == end:
+            total += 5
+        end = position
+    return total
+
+
+def tiers(query):
+    '''(pattern, in names, bound) for every kind of match score() tells
+    apart, best first. Each pattern matches at most once a line, of the
+    file names or of the paths, and no path it finds can score over
+    bound(length of the path).'''
+    escaped = [re.escape(char) for char in query]
+    scattered = ''.join('%s[^\\n%s]*' % (char, following) for char, following in zip(escaped, escaped[1:]))
+    return [
+        # the file name starts with the query
+        (re.compile('/%s[^\\n]*' % re.escape(query)), True, lambda length: 3200 - length),
+        # the file name holds it
+        (re.compile('%s[^\\n]*' % re.escape(query)), True, lambda length: 3000 - length),
+        # the path holds it
+        (re.compile('%s[^\\n]*' % re.escape(query)), False, lambda length: 2050 - length),
+        # the path holds its characters in order; every path that matches
+        (re.compile(scattered + escaped[-1] + '[^\\n]*'), False, lambda length: 1000 - length + 25 * len(query)),
+    ]
+
+
+def scan(pattern, text, starts, lines=1024):
+    '''The matches of pattern in text, lines lines at a time, with None
+    after each run of lines.'''
+    for first in range(0, len(starts) - 1, lines):
+        yield from pattern.finditer(text, starts[first], starts[min(first + lines, len(starts) - 1)])
+        yield None
+
+
+class FuzzySearch:
+    '''One query against a FuzzyMatcher, run in slices so a large list
+    never holds up a frame.
+
+    run(budget) works until it is done or budget seconds have passed, and
+    results() gives the best limit so far. Paths are scored tier by tier,
+    each in rank order, and a tier is left as soon as none of its
+    remaining paths can beat the limit already found; once ranked is set
+    the results are final and the rest of the run only collects every
+    match. A query that extends the one of a completed previous search
+    only looks through that search's matches for paths.'''
+
+    # paths looked at between looks at the clock
+    check_every = 256
+
+    def __init__(self, matcher, query, limit, previous=None):
+        self.matcher = matcher
+        self.query = query.lower()
+        self.limit = limit
+        # indexes of the paths matching, in rank order
+        self.matched = []
+        self.ranked = False
+        self.complete = False
+        # the best limit matches as (score, -index), worst first
+        self._best = []
+        self._previous = None
+        if not self.query:
+            # nothing typed yet: the first paths in rank order
+            self._best = [(0, -i) for i in range(min(limit, len(matcher.paths)))]
+            self.ranked = self.complete = True
+            return
+        if (previous is not None and previous.complete and previous.matcher is matcher
+                and previous.query and self.query.startswith(previous.query)):
+            self._previous = previous.matched
+        self._steps = self._search()
+
+    def run(self, budget):
+        '''Work for up to budget seconds. Returns True when done.'''
+        if self.complete:
+            return True
+        deadline = time.perf_counter() + budget
+        for step in self._steps:
+            if time.perf_counter() > deadline:
+                return False
+        self.complete = True
+        return True
+
+    def results(self):
+        '''The best paths so far, best first.'''
+        paths = self.matcher.paths
+        return [paths[-i] for value, i in sorted(self._best, reverse=True)]
+
+    # the generators below yield None every check_every paths or run of
+    # lines, so run() can look at the clock
+
+    def _search(self):
+        matcher = self.matcher
+        query = self.query
+        best = self._best
+        limit = self.limit
+        scored = set()
+        for pattern, names, bound in tiers(query):
+            for indexes in self._groups(pattern, names):
+                if indexes is None:
+                    yield
+                    continue
+                if len(best) == limit and best[0][0] > bound(matcher.length(indexes[0])):
+                    break
+                for i in indexes:
+                    if len(best) == limit and best[0][0] > bound(matcher.length(i)):
+                        break
+                    if i in scored:
+                        continue
+                    scored.add(i)
+                    path = matcher.lower(i)
+                    value = score(path, path.rfind('/') + 1, query)
+                    if value is None:
+                        pass
+                    elif len(best) < limit:
+                        heapq.heappush(best, (value, -i))
+                    elif (value, -i) > best[0]:
+                        heapq.heapreplace(best, (value, -i))
+                    if len(scored) % self.check_every == 0:
+                        yield
+        self.ranked = True
+        # the last tier finds every path that matches
+        for i in self._lines(pattern):
+            if i is None:
+                yield
+            else:
+                self.matched.append(i)
+
+    # the paths pattern finds, in rank order, as the paths of each file
+    # name found or one path at a time
+    def _groups(self, pattern, names):
+        if names:
+            starts = self.matcher.name_starts
+            for match in scan(pattern, self.matcher.names, starts):
+                yield None if match is None else self.matcher.named[bisect_right(starts, match.start()) - 1]
+        else:
+            for i in self._lines(pattern):
+                yield None if i is None else (i,)
+
+    # the indexes of the paths pattern finds, in rank order; every match
+    # is among the matches of the previous search
+    def _lines(self, pattern):
+        text = self.matcher.text
+        starts = self.matcher.starts
+        if self._previous is None:
+            for match in scan(pattern, text, starts):
+                yield None if match is None else bisect_right(starts, match.start()) - 1
+            return
+        for count, i in enumerate(self._previous, 1):
+            if pattern.search(text, starts[i], starts[i + 1]):
+                yield i
+            if count % self.check_every == 0:
+                yield None
+
+
+class FileList:
+    '''Every file under a folder, relative to it, with a FuzzyMatcher over
+    them for quick open.
+
+    refresh() walks the folder with the Find in Folder ignore rules. The
+    entries of every directory are kept with its mtime, so a later
+    refresh only lists the directories that changed since and the
+    matcher is only rebuilt when the list did. Lists stop at max_files.
+    refresh_in_background() runs it on a thread.'''
+
+    max_files = 500000
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.paths = None
+        self.matcher = None
+        # time.time() the last refresh finished
+        self.updated = None
+        # directory -> (mtime_ns, [(name, is_dir), ...])
+        self._directories = {}
+        self._thread = None
+
+    @property
+    def refreshing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def refresh_in_background(self):
+        if not self.refreshing:
+            self._thread = threading.Thread(target=self.refresh, daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        directories = {}
+        paths = []
+        prefix = len(os.path.join(self.root, ''))
+        stack = [(self.root, ())]
+        while stack and len(paths) < self.max_files:
+            directory, rules = stack.pop()
+            entries = self._entries(directory, directories)
+            if entries is None:
+                continue
+            if ('.gitignore', False) in entries:
+                own = IgnoreRules.read(os.path.join(directory, '.gitignore'))
+                if own is not None and own.rules:
+                    rules = rules + ((directory, own),)
+            for name, is_dir in entries:
+                if is_dir and name in IGNORED_DIRS:
+                    continue
+                path = os.path.join(directory, name)
+                if rules and ignored(rules, path, name, is_dir):
+                    continue
+                if is_dir:
+                    stack.append((path, rules))
+                else:
+                    paths.append(path[prefix:].replace(os.sep, '/'))
+        self._directories = directories
+        self.updated = time.time()
+        if paths != self.paths:
+            matcher = FuzzyMatcher(paths)
+            self.paths = paths
+            self.matcher = matcher
+
+    # the entries of a directory, listed again only if its mtime changed
+    def _entries(self, directory, directories):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._directories.get(directory)
+        if cached is not None and cached[0] == mtime:
+            directories[directory] = cached
+            return cached[1]
+        entries = []
+        try:
+            with os.scandir(directory) as listing:
+                for entry in listing:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            entries.append((entry.name, True))
+                        elif entry.is_file():
+                            entries.append((entry.name, False))
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        entries.sort()
+        directories[directory] = (mtime, entries)
+        return entries
+
+
+# file lists already made, by folder
+_file_lists = {}
+
+
+def file_list(root):
+    '''The shared FileList of a folder, empty until it is first
+    refreshed.'''
+    root = os.path.abspath(root)
+    files = _file_lists.get(root)
+    if files is None:
+        files = _file_lists[root] = FileList(root)
+    return files
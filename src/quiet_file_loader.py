@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+import tkinter as tk
+
+
+class FileLoader:
+    '''Streams a file into the text area without blocking the editor.
+
+    A reader thread decodes the file in blocks of block_size characters and
+    hands them over through a bounded queue, so at most a few blocks sit in
+    memory besides the text widget. The Tk thread inserts them at the end
+    of the buffer in slices of at most insert_budget seconds, reporting
+    progress in the status bar. cancel() stops partway and keeps whatever
+    was loaded so far.'''
+
+    block_size = 1 << 20
+    queued_blocks = 4
+    insert_budget = 0.02
+    poll_interval = 10
+
+    def __init__(self, parent):
+        self._parent = parent
+        self.textarea = parent.textarea
+        self.statusbar = parent.statusbar
+        self.path = None
+        self.loading = False
+        self._blocks = None
+        self._cancelled = threading.Event()
+        self._poll_job = None
+        self._on_done = None
+        self._size = 0
+        self._read = 0
+
+    def open(self, path, on_done):
+        '''Replace the text with the contents of path, then call
+        on_done(completed) where completed is False when cancelled or
+        the file could not be read.'''
+        self.cancel()
+        self.path = path
+        self._on_done = on_done
+        self._size = os.path.getsize(path)
+        self.textarea.delete(1.0, tk.END)
+
+        # small files are not worth a thread
+        if self._size <= self.block_size:
+            try:
+                with open(path, 'r') as f:
+                    self.textarea.insert(1.0, f.read())
+            except (OSError, UnicodeDecodeError) as e:
+                self._finish(e)
+                return
+            self._finish()
+            return
+
+        # the undo stack would keep a second copy of the whole file
+        self.textarea.configure(undo=False)
+        self.loading = True
+        self._read = 0
+        self._blocks = queue.Queue(self.queued_blocks)
+        self._cancelled = threading.Event()
+        thread = threading.Thread(target=self._read_blocks,
+                                  args=(path, self._blocks, self._cancelled),
+                                  daemon=True)
+        thread.start()
+        self._poll_job = self.textarea.after(self.poll_interval, self._insert_blocks)
+
+    def cancel(self):
+        if not self.loading:
+            return
+        self._cancelled.set()
+        self._finish(cancelled=True)
+
+    def _read_blocks(self, path, blocks, cancelled):
+        def put(item):
+            while not cancelled.is_set():
+                try:
+                    blocks.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        try:
+            with open(path, 'r') as f:
+                while not cancelled.is_set():
+                    block = f.read(self.block_size)
+                    if not block:
+                        break
+                    put((block, f.buffer.tell()))
+        except (OSError, UnicodeDecodeError) as e:
+            put((e, None))
+            return
+        put((None, None))
+
+    def _insert_blocks(self):
+        self._poll_job = None
+        deadline = time.perf_counter() + self.insert_budget
+        while time.perf_counter() < deadline:
+            try:
+                block, position = self._blocks.get_nowait()
+            except queue.Empty:
+                break
+            if block is None:
+                self._finish()
+                return
+            if isinstance(block, Exception):
+                self._finish(block)
+                return
+            self.textarea.insert('end-1c', block)
+            self._read = position
+
+        percent = 100 * self._read // self._size if self._size else 100
+        self.statusbar.display_status_message(
+            'Opening %s: %d%% (Esc to cancel)' % (os.path.basename(self.path), percent),
+            msg_type='hint')
+        self._poll_job = self.textarea.after(self.poll_interval, self._insert_blocks)
+
+    def _finish(self, error=None, cancelled=False):
+        if self._poll_job is not None:
+            self.textarea.after_cancel(self._poll_job)
+            self._poll_job = None
+        if self.loading:
+            self.loading = False
+            self.textarea.configure(undo=True)
+        self.textarea.edit_reset()
+        self._blocks = None
+
+        if error is not None:
+            self.statusbar.display_status_message('Unable to read %s: %s'
+                                                  % (os.path.basename(self.path), error))
+        elif cancelled:
+            self.statusbar.display_status_message(
+                'Stopped opening %s at %d%%; save will ask for a new name.'
+                % (os.path.basename(self.path), 100 * self._read // self._size), msg_type='hint')
+        else:
+            self.statusbar.update_status('hide')
+        on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done(error is None and not cancelled)
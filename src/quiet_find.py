@@ -1,14 +1,21 @@
+import re
+import time
 import tkinter as tk
 import tkinter.ttk as ttk
 
 
 class FindWindow(tk.Toplevel):
-    def __init__(self, master, **kwargs):
+    # pause in typing before the find entry searches
+    search_delay = 150
+
+    def __init__(self, master, statusbar=None, **kwargs):
         super().__init__(**kwargs)
 
         self.master = master
+        self.statusbar = statusbar
+        self._search_job = None
 
-        self.geometry('450x100')
+        self.geometry('520x130')
         self.title('Find and Replace')
         self.transient(self.master)
         self.configure(bg=self.master.bg_color)
@@ -16,51 +23,120 @@ class FindWindow(tk.Toplevel):
 
         self.text_to_find = tk.StringVar()
         self.text_to_replace_with = tk.StringVar()
+        self.regex = tk.BooleanVar(value=False)
+        self.match_case = tk.BooleanVar(value=True)
+        self.whole_word = tk.BooleanVar(value=False)
 
         top_frame = tk.Frame(self, bg=self.master.bg_color)
+        options_frame = tk.Frame(self, bg=self.master.bg_color)
         middle_frame = tk.Frame(self, bg=self.master.bg_color)
         bottom_frame = tk.Frame(self, bg=self.master.bg_color)
 
         find_entry_label = ttk.Label(top_frame, text="Find: ", style="editor.TLabel")
         self.find_entry = ttk.Entry(top_frame, textvar=self.text_to_find)
+        # "n of N", replace all results or what went wrong
+        self.status_label = ttk.Label(top_frame, width=24, anchor=tk.E, style="editor.TLabel")
+
+        regex_check = ttk.Checkbutton(options_frame, text="Regex", variable=self.regex,
+                                      style="editor.TCheckbutton")
+        case_check = ttk.Checkbutton(options_frame, text="Match case", variable=self.match_case,
+                                     style="editor.TCheckbutton")
+        word_check = ttk.Checkbutton(options_frame, text="Whole word", variable=self.whole_word,
+                                     style="editor.TCheckbutton")
 
         replace_entry_label = ttk.Label(middle_frame, text="Replace: ", style="editor.TLabel")
         self.replace_entry = ttk.Entry(middle_frame, textvar=self.text_to_replace_with)
 
         self.find_button = ttk.Button(bottom_frame, text="Find", command=self.on_find, style="editor.TButton")
         self.replace_button = ttk.Button(bottom_frame, text="Replace", command=self.on_replace, style="editor.TButton")
+        self.replace_all_button = ttk.Button(bottom_frame, text="Replace All", command=self.on_replace_all,
+                                             style="editor.TButton")
         self.cancel_button = ttk.Button(bottom_frame, text="Cancel", command=self.on_cancel, style="editor.TButton")
 
         find_entry_label.pack(side=tk.LEFT, padx=(20, 0))
         self.find_entry.pack(side=tk.LEFT, fill=tk.X, expand=1)
+        self.status_label.pack(side=tk.LEFT)
+
+        regex_check.pack(side=tk.LEFT, padx=(20, 10))
+        case_check.pack(side=tk.LEFT, padx=(0, 10))
+        word_check.pack(side=tk.LEFT)
 
         replace_entry_label.pack(side=tk.LEFT)
         self.replace_entry.pack(side=tk.LEFT, fill=tk.X, expand=1)
 
-        self.find_button.pack(side=tk.LEFT, padx=(85, 0))
-        self.replace_button.pack(side=tk.LEFT, padx=(20, 20))
+        self.find_button.pack(side=tk.LEFT, padx=(40, 0))
+        self.replace_button.pack(side=tk.LEFT, padx=(20, 0))
+        self.replace_all_button.pack(side=tk.LEFT, padx=(20, 20))
         self.cancel_button.pack(side=tk.RIGHT, padx=(0, 30))
 
         top_frame.pack(side=tk.TOP, expand=1, fill=tk.X, padx=30)
+        options_frame.pack(side=tk.TOP, expand=1, fill=tk.X, padx=30)
         middle_frame.pack(side=tk.TOP, expand=1, fill=tk.X, padx=30)
         bottom_frame.pack(side=tk.TOP, expand=1, fill=tk.X)
 
         self.find_entry.focus_force()
+        self.find_entry.bind('<Return>', lambda event: self.on_find())
+        self.master.find_engine.listener = self.show_status
+        # search as you type, and again when an option changes
+        for variable in (self.text_to_find, self.regex, self.match_case, self.whole_word):
+            variable.trace_add('write', self.on_query_changed)
 
         self.protocol("WM_DELETE_WINDOW", self.on_cancel)
 
-        self.minsize(450, 100)
+        self.minsize(520, 130)
+
+    def on_query_changed(self, *args):
+        if self.master.large_file is not None:
+            # large files are searched straight from disk, one Find at a time
+            return
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(self.search_delay, self.on_find)
 
     def on_find(self):
-        self.master.find(self.text_to_find.get())
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+            self._search_job = None
+        try:
+            self.master.find(self.text_to_find.get(),
+                             regex=self.regex.get(),
+                             case=self.match_case.get(),
+                             whole_word=self.whole_word.get())
+        except re.error:
+            self.status_label.configure(text='Bad regex')
 
     def on_replace(self):
-        self.master.replace_text(self.text_to_find.get(), self.text_to_replace_with.get())
+        self.master.replace_text(self.text_to_replace_with.get())
+
+    def on_replace_all(self):
+        started = time.perf_counter()
+        try:
+            count = self.master.replace_all(self.text_to_find.get(),
+                                            self.text_to_replace_with.get(),
+                                            regex=self.regex.get(),
+                                            case=self.match_case.get(),
+                                            whole_word=self.whole_word.get())
+        except re.error:
+            # a bad pattern or a group reference it does not have
+            self.status_label.configure(text='Bad regex')
+            return
+        self.status_label.configure(text='Replaced %d (%d ms)' % (count, (time.perf_counter() - started) * 1000))
 
     def on_cancel(self):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self.master.find_engine.listener = None
         self.master.cancel_find()
+        if self.statusbar is not None:
+            self.statusbar.update_status('hide')
         self.destroy()
 
+    def show_status(self, engine):
+        status = engine.status()
+        self.status_label.configure(text=status)
+        if self.statusbar is not None and status:
+            self.statusbar.display_status_message('Find: %s' % status, msg_type='hint')
+
 
 
 
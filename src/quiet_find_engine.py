@@ -0,0 +1,413 @@
+import queue
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+def compile_pattern(text, regex=False, case=True, whole_word=False):
+    '''The search pattern for a query. Raises re.error for a bad regex.'''
+    source = text if regex else re.escape(text)
+    if whole_word:
+        source = r'(?<!\w)(?:%s)(?!\w)' % source
+    flags = re.MULTILINE if case else re.MULTILINE | re.IGNORECASE
+    return re.compile(source, flags)
+
+
+class FindEngine:
+    '''Every match of a query in a CustomText, as sorted arrays of start and
+    end offsets into its document.
+
+    The first index is built from a document snapshot on a background
+    thread. After that, edits only rescan the lines they touched, plus a
+    line either side and any match that overlapped them, and shift the
+    offsets of the matches after them. A regex is only rescanned that
+    far, so a match spanning several lines can be missed until the next
+    full scan.
+
+    While a plain query is being typed, each longer query only checks the
+    matches of the previous one instead of scanning the text again, as
+    long as the previous text cannot overlap itself. A new search retires
+    the scan before it, which notices within one chunk of scan_chunk
+    characters.
+
+    Matches in the viewport are tagged 'find_match', all in one call, and
+    the current one 'find_current'. listener(engine) is called whenever
+    the count or the current match changes.'''
+
+    poll_interval = 20
+    # characters scanned between checks for a newer search
+    scan_chunk = 1 << 20
+    # text either side of a rescanned range that lookarounds can see
+    context_chars = 256
+
+    def __init__(self, textarea):
+        self.textarea = textarea
+        self.query = None
+        self.pattern = None
+        self.starts = array('q')
+        self.ends = array('q')
+        self.current = None
+        self.complete = False
+        self.listener = None
+        self.job = 0
+        self.results = queue.Queue()
+        self._document = None
+        self._revision = None
+        self._poll_job = None
+        self._pending_next = None
+        self._subscribed = False
+
+    def search(self, text, regex=False, case=True, whole_word=False):
+        '''Index every match of the query, unless it is the one already
+        indexed.'''
+        query = (text, regex, case, whole_word)
+        if query == self.query:
+            return
+        pattern = compile_pattern(*query) if text else None
+        candidates = None
+        if pattern is not None and _narrows(self.query, query) and self.complete and self._catch_up():
+            candidates = self.starts
+        self.clear()
+        self.query = query
+        self.pattern = pattern
+        if pattern is None:
+            return
+        if not self._subscribed:
+            self.textarea.subscribe(self.on_text_change)
+            self._subscribed = True
+        self._start_scan(candidates)
+        self._notify()
+
+    def clear(self):
+        self.job += 1
+        self.query = self.pattern = None
+        self.starts = array('q')
+        self.ends = array('q')
+        self.current = None
+        self.complete = False
+        self._document = None
+        self._pending_next = None
+        if self._subscribed:
+            self.textarea.unsubscribe(self.on_text_change)
+            self._subscribed = False
+        self.textarea.tag_remove('find_match', 1.0, 'end')
+        self.textarea.tag_remove('find_current', 1.0, 'end')
+        self._notify()
+
+    def next(self, backwards=False):
+        '''Select the next match after the current one, or after the cursor
+        once it has moved, wrapping around at either end.'''
+        if self.pattern is None:
+            return
+        if not self.complete:
+            # go there once the scan is done
+            self._pending_next = backwards
+            return
+        if not self.starts:
+            self._notify()
+            return
+        offset = self._insert_offset()
+        if self.current is not None and self.starts[self.current] == offset:
+            i = self.current + (-1 if backwards else 1)
+        else:
+            i = bisect_left(self.starts, offset) - (1 if backwards else 0)
+        self.current = i % len(self.starts)
+        self._show_current()
+
+    def replace_current(self, replacement):
+        '''Replace the selected match, expanding group references for a
+        regex, and select the next one.'''
+        if not self.complete or self.current is None:
+            self.next()
+            return
+        document = self.textarea.document
+        start, end = self.starts[self.current], self.ends[self.current]
+        if self.query[1]:
+            base = max(start - self.context_chars, 0)
+            match = self.pattern.match(document.slice(base, end + self.context_chars), start - base)
+            if match is not None:
+                replacement = match.expand(replacement)
+        start_index = '%d.%d' % document.position(start)
+        self.textarea.replace(start_index, '%d.%d' % document.position(end), replacement)
+        # carry on after the replacement, not inside it
+        self.textarea.mark_set('insert', '%d.%d' % document.position(start + len(replacement)))
+        if self._catch_up():
+            self.next()
+
+    def replace_all(self, replacement):
+        '''Replace every match in one pass over the text, applied as a
+        single widget edit from the first match to the last, which undoes
+        in one step. Returns how many matches were replaced.'''
+        if self.pattern is None:
+            return 0
+        document = self.textarea.document
+        text = document.text()
+        literal = not self.query[1]
+        # a literal only needs its backslashes escaped to be a template
+        template = replacement.replace('\\', '\\\\') if literal else replacement
+        # first and last come from the matches actually replaced, never
+        # from the index, which may lag behind the text
+        new_text, count, first, last = self._substitute(text, template)
+        if not count:
+            return 0
+
+        middle = new_text[first:len(new_text) - (len(text) - last)]
+        start_index = '%d.%d' % document.position(first)
+        self.textarea.edit_separator()
+        self.textarea.replace(start_index, '%d.%d' % document.position(last), middle)
+        self.textarea.edit_separator()
+        # Tk columns, which differ from characters after an astral one
+        self.textarea.mark_set('insert', '%d.%d' % document.position(first + len(middle)))
+        if self.complete and self._catch_up():
+            self._show_visible()
+        self._notify()
+        return count
+
+    # replace the non-empty matches only, without the index
+    def _substitute(self, text, template):
+        count = 0
+        first = last = None
+
+        def substitute(match):
+            nonlocal count, first, last
+            start, end = match.span()
+            if start == end:
+                return ''
+            count += 1
+            if first is None:
+                first = start
+            last = end
+            return match.expand(template)
+
+        return self.pattern.sub(substitute, text), count, first, last
+
+    def status(self):
+        '''"n of N" for the find window.'''
+        if self.pattern is None:
+            return ''
+        if not self.complete:
+            return 'Searching...'
+        if not self.starts:
+            return 'No results'
+        if self.current is None:
+            return '%d matches' % len(self.starts)
+        return '%d of %d' % (self.current + 1, len(self.starts))
+
+    def on_text_change(self, change):
+        if not self.complete:
+            return
+        if 'edit' in change.kinds:
+            before = (len(self.starts), self.current)
+            if not self._catch_up():
+                return
+            if (len(self.starts), self.current) != before:
+                self._notify()
+        if 'edit' in change.kinds or 'view' in change.kinds:
+            self._show_visible()
+
+    # scan the whole text, or only the offsets in candidates
+    def _start_scan(self, candidates=None):
+        self.job += 1
+        self.complete = False
+        thread = threading.Thread(target=self._scan,
+                                  args=(self.job, self.query, self.pattern, self.textarea.document.snapshot(),
+                                        self.textarea.revision, candidates),
+                                  daemon=True)
+        thread.start()
+        if self._poll_job is None:
+            self._poll_job = self.textarea.after(self.poll_interval, self._poll)
+
+    def _scan(self, job, query, pattern, document, revision, candidates):
+        text = document.text()
+        starts = array('q')
+        ends = array('q')
+        if candidates is None:
+            for spans in self._chunked_spans(pattern, text):
+                if job != self.job:
+                    return
+                # empty matches cannot be shown
+                starts.extend([start for start, end in spans if start != end])
+                ends.extend([end for start, end in spans if start != end])
+        else:
+            # only plain text narrows, so every match is as long as the query
+            needle = query[0]
+            if query[2] or (text.isascii() and needle.isascii()):
+                # lower() folds ASCII the way re.IGNORECASE does, so
+                # compare the strings
+                folded = text if query[2] else text.lower()
+                key = needle if query[2] else needle.lower()
+
+                def found(start):
+                    return folded.startswith(key, start)
+            else:
+                # re.IGNORECASE also folds the likes of dotless i, long s
+                # and the Kelvin sign, which lower() does not match up
+                match = pattern.match
+
+                def found(start):
+                    return match(text, start) is not None
+            batch = self.scan_chunk >> 4
+            for i in range(0, len(candidates), batch):
+                if job != self.job:
+                    return
+                starts.extend([start for start in candidates[i:i + batch] if found(start)])
+            if _overlaps_itself(needle, query[2]):
+                # keep the matches finditer would have found
+                kept = array('q')
+                for start in starts:
+                    if not kept or start >= kept[-1] + len(needle):
+                        kept.append(start)
+                starts = kept
+            ends = array('q', [start + len(needle) for start in starts])
+        if job == self.job:
+            self.results.put((job, document, revision, starts, ends))
+
+    # finditer over chunks that end on a line end; re holds the GIL while
+    # it searches, so this also keeps long scans from stalling the editor
+    def _chunked_spans(self, pattern, text):
+        position = 0
+        while position < len(text):
+            end = text.find('\n', position + self.scan_chunk)
+            end = len(text) if end < 0 else end + 1
+            yield [match.span() for match in pattern.finditer(text, position, end)]
+            position = end
+
+    def _poll(self):
+        self._poll_job = None
+        while True:
+            try:
+                job, document, revision, starts, ends = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if job != self.job:
+                continue
+            self._document = document
+            self._revision = revision
+            self.starts = starts
+            self.ends = ends
+            self.current = None
+            self.complete = True
+            if not self._catch_up():
+                break
+            self._show_visible()
+            if self._pending_next is not None:
+                backwards, self._pending_next = self._pending_next, None
+                self.next(backwards)
+            self._notify()
+            return
+        if self._poll_job is None and self.pattern is not None and not self.complete:
+            self._poll_job = self.textarea.after(self.poll_interval, self._poll)
+
+    # bring the index up to date with the edits made since it was built;
+    # False when they are lost from the history and a new scan started
+    def _catch_up(self):
+        changes = self.textarea.changes_since(self._revision)
+        if changes is None:
+            self._start_scan()
+            return False
+        if not changes:
+            return True
+
+        # one window of lines covering every change, in current lines,
+        # and how many lines it grew by
+        first = last = None
+        added = 0
+        for revision, kind, start, old_end, new_end in changes:
+            if first is None:
+                first, last = start[0], new_end[0]
+            else:
+                if last >= old_end[0]:
+                    last += new_end[0] - old_end[0]
+                first = min(first, start[0])
+                last = max(last, new_end[0])
+            added += new_end[0] - old_end[0]
+
+        old = self._document
+        new = self.textarea.document
+        low = old.offset(first - 1, 0)
+        old_high = old.offset(last - added + 2, 0)
+        new_high = new.offset(last + 2, 0)
+        shift = new_high - old_high
+
+        # matches overlapping the window are found again
+        starts, ends = self.starts, self.ends
+        i = bisect_right(ends, low)
+        j = bisect_left(starts, old_high)
+        if i < j:
+            low = min(low, starts[i])
+            new_high = max(old_high, ends[j - 1]) + shift
+
+        base = max(low - self.context_chars, 0)
+        text = new.slice(base, new_high + self.context_chars)
+        found_starts = array('q')
+        found_ends = array('q')
+        for match in self.pattern.finditer(text, low - base):
+            start, end = match.span()
+            if start + base >= new_high:
+                break
+            if start != end:
+                found_starts.append(start + base)
+                found_ends.append(end + base)
+
+        self.starts = starts[:i] + found_starts + array('q', [start + shift for start in starts[j:]])
+        self.ends = ends[:i] + found_ends + array('q', [end + shift for end in ends[j:]])
+        if self.current is not None:
+            if self.current >= j:
+                self.current += len(found_starts) - (j - i)
+            elif self.current >= i:
+                self.current = None
+        self._document = new.snapshot()
+        self._revision = self.textarea.revision
+        return True
+
+    # tag the matches in the viewport with one call
+    def _show_visible(self):
+        text = self.textarea
+        first = int(text.index('@0,0').split('.')[0])
+        last = int(text.index('@0,%d' % text.winfo_height()).split('.')[0])
+        document = text.document
+        i = bisect_right(self.ends, document.offset(first, 0))
+        j = bisect_left(self.starts, document.offset(last + 1, 0))
+        indices = []
+        for k in range(i, j):
+            indices.append('%d.%d' % document.position(self.starts[k]))
+            indices.append('%d.%d' % document.position(self.ends[k]))
+        text.tag_remove('find_match', '%d.0' % first, '%d.0' % (last + 1))
+        text.tag_add_ranges('find_match', indices)
+
+    def _show_current(self):
+        document = self.textarea.document
+        start = '%d.%d' % document.position(self.starts[self.current])
+        end = '%d.%d' % document.position(self.ends[self.current])
+        self.textarea.tag_remove('find_current', 1.0, 'end')
+        self.textarea.tag_add('find_current', start, end)
+        self.textarea.mark_set('insert', start)
+        self.textarea.see(start)
+        self._show_visible()
+        self._notify()
+
+    def _insert_offset(self):
+        line, col = self.textarea.index('insert').split('.')
+        return self.textarea.document.offset(int(line), int(col))
+
+    def _notify(self):
+        if self.listener is not None:
+            self.listener(self)
+
+
+# whether every match of new is at a match of old, so that searching for
+# new only has to check those
+def _narrows(old, new):
+    if old is None or old[1:] != new[1:] or new[1] or new[3]:
+        return False
+    # a needle that can overlap itself has occurrences finditer skipped
+    return new[0].startswith(old[0]) and not _overlaps_itself(old[0], old[2])
+
+
+def _overlaps_itself(needle, case):
+    if case:
+        return any(needle[k:] == needle[:-k] for k in range(1, len(needle)))
+    # folded the way the search folds, which lower() does not always match
+    return any(re.fullmatch(re.escape(needle[k:]), needle[:-k], re.IGNORECASE)
+               for k in range(1, len(needle)))
@@ -0,0 +1,198 @@
+import os
+import re
+import tkinter as tk
+import tkinter.ttk as ttk
+
+from quiet_find_engine import compile_pattern
+from quiet_folder_search import FolderSearch
+
+
+class FindFolderWindow(tk.Toplevel):
+    '''Searches every file under a folder and lists the matches as they
+    come in. Double clicking one, or Return on it, opens the file at that
+    line.'''
+
+    # matches listed; the search still counts the rest
+    max_listed = 10000
+    index_status_interval = 1000
+    result_line_chars = 120
+
+    def __init__(self, master, editor, **kwargs):
+        super().__init__(**kwargs)
+
+        self.master = master
+        self.editor = editor
+        self.search = FolderSearch(self)
+        # (path, line) of every listed match, by listbox row
+        self.results = []
+        self.root = None
+        self._index_status_job = None
+
+        self.geometry('720x420')
+        self.title('Find in Folder')
+        self.transient(self.master)
+        self.configure(bg=self.master.bg_color)
+
+        self.folder = tk.StringVar(value=os.path.dirname(editor.filename or '') or os.getcwd())
+        self.text_to_find = tk.StringVar()
+        self.regex = tk.BooleanVar(value=False)
+        self.match_case = tk.BooleanVar(value=True)
+        self.whole_word = tk.BooleanVar(value=False)
+
+        folder_frame = tk.Frame(self, bg=self.master.bg_color)
+        top_frame = tk.Frame(self, bg=self.master.bg_color)
+        options_frame = tk.Frame(self, bg=self.master.bg_color)
+        list_frame = tk.Frame(self, bg=self.master.bg_color)
+        bottom_frame = tk.Frame(self, bg=self.master.bg_color)
+
+        folder_label = ttk.Label(folder_frame, text="Folder: ", style="editor.TLabel")
+        folder_entry = ttk.Entry(folder_frame, textvar=self.folder)
+        browse_button = ttk.Button(folder_frame, text="Browse", command=self.on_browse, style="editor.TButton")
+
+        find_entry_label = ttk.Label(top_frame, text="Find: ", style="editor.TLabel")
+        self.find_entry = ttk.Entry(top_frame, textvar=self.text_to_find)
+        self.find_button = ttk.Button(top_frame, text="Search", command=self.on_find, style="editor.TButton")
+        self.cancel_button = ttk.Button(top_frame, text="Cancel", command=self.on_cancel, style="editor.TButton")
+
+        regex_check = ttk.Checkbutton(options_frame, text="Regex", variable=self.regex,
+                                      style="editor.TCheckbutton")
+        case_check = ttk.Checkbutton(options_frame, text="Match case", variable=self.match_case,
+                                     style="editor.TCheckbutton")
+        word_check = ttk.Checkbutton(options_frame, text="Whole word", variable=self.whole_word,
+                                     style="editor.TCheckbutton")
+        # matches, files and speed, or what went wrong
+        self.status_label = ttk.Label(options_frame, anchor=tk.E, style="editor.TLabel")
+
+        self.result_list = tk.Listbox(list_frame, activestyle='none', bd=0, highlightthickness=0,
+                                      bg=self.master.bg_color, fg=self.master['fg'],
+                                      selectbackground=self.master['selectbackground'],
+                                      font=self.master['font'])
+        scrolly = ttk.Scrollbar(list_frame, command=self.result_list.yview)
+        self.result_list.configure(yscrollcommand=scrolly.set)
+        # size and age of the folder's trigram index
+        self.index_label = ttk.Label(bottom_frame, anchor=tk.W, style="editor.TLabel")
+
+        folder_label.pack(side=tk.LEFT)
+        folder_entry.pack(side=tk.LEFT, fill=tk.X, expand=1)
+        browse_button.pack(side=tk.LEFT, padx=(10, 0))
+
+        find_entry_label.pack(side=tk.LEFT, padx=(12, 0))
+        self.find_entry.pack(side=tk.LEFT, fill=tk.X, expand=1)
+        self.find_button.pack(side=tk.LEFT, padx=(10, 0))
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
+
+        regex_check.pack(side=tk.LEFT, padx=(0, 10))
+        case_check.pack(side=tk.LEFT, padx=(0, 10))
+        word_check.pack(side=tk.LEFT)
+        self.status_label.pack(side=tk.RIGHT, fill=tk.X, expand=1)
+
+        scrolly.pack(side=tk.RIGHT, fill=tk.Y)
+        self.result_list.pack(side=tk.LEFT, fill='both', expand=1)
+        self.index_label.pack(side=tk.LEFT, fill=tk.X, expand=1)
+
+        folder_frame.pack(side=tk.TOP, fill=tk.X, padx=20, pady=(10, 0))
+        top_frame.pack(side=tk.TOP, fill=tk.X, padx=20, pady=(5, 0))
+        options_frame.pack(side=tk.TOP, fill=tk.X, padx=20, pady=5)
+        bottom_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=20, pady=(0, 5))
+        list_frame.pack(side=tk.TOP, fill='both', expand=1, padx=20, pady=(0, 5))
+
+        self.find_entry.focus_force()
+        self.find_entry.bind('<Return>', lambda event: self.on_find())
+        self.result_list.bind('<Double-Button-1>', self.on_open_result)
+        self.result_list.bind('<Return>', self.on_open_result)
+        self.bind('<Escape>', lambda event: self.on_cancel())
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.minsize(520, 240)
+
+        # bring the index up to date while the query is being typed
+        folder = os.path.expanduser(self.folder.get())
+        if os.path.isdir(folder):
+            self.root = os.path.abspath(folder)
+            self.search.update_index(self.root)
+        self.show_index_status()
+
+    def on_browse(self):
+        from tkinter import filedialog
+        folder = filedialog.askdirectory(parent=self, initialdir=self.folder.get() or None)
+        if folder:
+            self.folder.set(folder)
+
+    def on_find(self):
+        root = os.path.expanduser(self.folder.get())
+        query = self.text_to_find.get()
+        if not query:
+            return
+        if not os.path.isdir(root):
+            self.status_label.configure(text='Not a folder')
+            return
+        try:
+            pattern = compile_pattern(query,
+                                      regex=self.regex.get(),
+                                      case=self.match_case.get(),
+                                      whole_word=self.whole_word.get())
+        except re.error:
+            self.status_label.configure(text='Bad regex')
+            return
+        self.result_list.delete(0, tk.END)
+        self.results = []
+        self.root = os.path.abspath(root)
+        self.search.start(root, pattern, self.add_results, self.search_done)
+        self.status_label.configure(text='Searching...')
+
+    def on_cancel(self):
+        if self.search.running:
+            self.search.cancel()
+        else:
+            self.on_close()
+
+    def on_close(self):
+        self.search.shutdown()
+        if self._index_status_job is not None:
+            self.after_cancel(self._index_status_job)
+        self.destroy()
+
+    def on_open_result(self, event=None):
+        selection = self.result_list.curselection()
+        if selection:
+            path, line = self.results[selection[0]]
+            self.editor.open_file_at(path, line)
+        return 'break'
+
+    # called with every batch of matches while the search runs
+    def add_results(self, matches):
+        room = self.max_listed - len(self.results)
+        if room > 0:
+            matches = matches[:room]
+            self.results.extend((path, line) for path, line, col, text in matches)
+            self.result_list.insert(tk.END, *['%s:%d: %s' % (os.path.relpath(path, self.root), line,
+                                                           text.strip()[:self.result_line_chars])
+                                              for path, line, col, text in matches])
+        self.show_status()
+
+    def search_done(self, cancelled):
+        if self.winfo_exists():
+            self.show_status(' (cancelled)' if cancelled else '')
+        if not cancelled:
+            # pick up the files the search found changed
+            self.search.update_index(self.root)
+
+    def show_status(self, suffix=''):
+        search = self.search
+        status = '%d matches in %d files, %d files searched, %d matches/s' % (
+            search.matches, search.matched_files, search.files, search.rate())
+        if search.skipped:
+            status += ', %d too big' % search.skipped
+        if search.selection is not None and search.selection.skipped:
+            status += ', %d ruled out by the index' % search.selection.skipped
+        if search.matches > len(self.results):
+            status += ', first %d listed' % len(self.results)
+        self.status_label.configure(text=status + suffix)
+
+    # refreshed every second, since the age of the index keeps changing
+    def show_index_status(self):
+        self._index_status_job = None
+        if self.root is not None:
+            self.index_label.configure(text=self.search.index_status(self.root))
+        self._index_status_job = self.after(self.index_status_interval, self.show_index_status)
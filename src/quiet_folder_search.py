@@ -0,0 +1,487 @@
+import fnmatch
+import mmap
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from quiet_trigram_index import file_trigrams, trigram_index
+
+# never worth searching, whatever the ignore files say
+IGNORED_DIRS = frozenset(['.git', '.hg', '.svn', '__pycache__', 'node_modules',
+                          '.venv', '.tox', '.mypy_cache', '.pytest_cache', '.idea'])
+# a NUL byte this early means a binary file
+BINARY_CHECK_BYTES = 8192
+# longest line text kept with a match
+LINE_TEXT_CHARS = 200
+
+
+class IgnoreRules:
+    '''The patterns of one .gitignore, matched against paths relative to the
+    directory holding it.
+
+    Supports the common subset: globs, a leading '/' or inner '/' to anchor
+    a pattern to that directory, a trailing '/' for directories only and
+    a leading '!' to re-include. A '*' may cross directories.'''
+
+    def __init__(self, lines=()):
+        self.rules = []
+        for line in lines:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            line = line.lstrip('/').replace('**/', '*')
+            if line:
+                self.rules.append((re.compile(fnmatch.translate(line)).match, negate, dir_only, anchored))
+
+    @classmethod
+    def read(cls, path):
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                return cls(f)
+        except OSError:
+            return None
+
+    def match(self, relative, name, is_dir):
+        '''True to ignore, False to keep, None when no rule says.'''
+        result = None
+        for match, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if match(relative if anchored else name):
+                result = not negate
+        return result
+
+
+def walk_files(root, max_bytes=None, cancelled=None):
+    '''Yield (path, stat result) for every regular file under root that
+    the ignore rules keep, and (path, None) for files skipped as bigger
+    than max_bytes. Symbolic links to directories are not followed.'''
+    # directories to visit, each with the rules in force there as
+    # (directory the rules are relative to, rules) from the outside in
+    stack = [(root, ())]
+    while stack:
+        if cancelled is not None and cancelled.is_set():
+            return
+        directory, rules = stack.pop()
+        own = IgnoreRules.read(os.path.join(directory, '.gitignore'))
+        if own is not None and own.rules:
+            rules = rules + ((directory, own),)
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if is_dir and entry.name in IGNORED_DIRS:
+                continue
+            if ignored(rules, entry.path, entry.name, is_dir):
+                continue
+            if is_dir:
+                subdirectories.append(entry.path)
+                continue
+            try:
+                info = entry.stat()
+            except OSError:
+                continue
+            if max_bytes is not None and info.st_size > max_bytes:
+                yield entry.path, None
+            else:
+                yield entry.path, info
+        # popped in name order, so results come out roughly sorted
+        subdirectories.sort(reverse=True)
+        stack.extend((path, rules) for path in subdirectories)
+
+
+def ignored(rules, path, name, is_dir):
+    '''Whether the last of the (base directory, IgnoreRules) pairs that says
+    anything about a path ignores it.'''
+    verdict = False
+    for base, own in rules:
+        relative = os.path.relpath(path, base).replace(os.sep, '/')
+        result = own.match(relative, name, is_dir)
+        if result is not None:
+            verdict = result
+    return verdict
+
+
+# runs in a pool process; returns (path, [(line, col, line text), ...])
+# for every file in the batch with at least one match
+def grep_files(paths, source, flags, mmap_bytes, max_matches):
+    pattern = re.compile(source, flags)
+    binary_pattern = None
+    found = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= mmap_bytes:
+                    if binary_pattern is None:
+                        # str patterns carry re.UNICODE, which bytes refuse
+                        binary_pattern = re.compile(source.encode('utf-8'), flags & ~re.UNICODE)
+                    matches = _grep_mapped(f, size, binary_pattern, max_matches)
+                else:
+                    matches = _grep_text(f.read(), pattern, max_matches)
+        except (OSError, ValueError):
+            continue
+        if matches:
+            found.append((path, matches))
+    return found
+
+
+def _grep_text(data, pattern, max_matches):
+    if b'\0' in data[:BINARY_CHECK_BYTES]:
+        return None
+    text = data.decode('utf-8', 'replace')
+    matches = []
+    line = 1
+    counted = 0
+    for match in pattern.finditer(text):
+        start = match.start()
+        line += text.count('\n', counted, start)
+        counted = start
+        line_start = text.rfind('\n', 0, start) + 1
+        line_end = text.find('\n', start)
+        if line_end < 0:
+            line_end = len(text)
+        matches.append((line, start - line_start, text[line_start:min(line_end, line_start + LINE_TEXT_CHARS)]))
+        if len(matches) >= max_matches:
+            break
+    return matches
+
+
+# large files are searched in place; columns are in bytes, which only
+# differ from characters on lines with non-ASCII text
+def _grep_mapped(f, size, pattern, max_matches):
+    with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+        if data.find(b'\0', 0, BINARY_CHECK_BYTES) >= 0:
+            return None
+        matches = []
+        line = 1
+        counted = 0
+        for match in pattern.finditer(data):
+            start = match.start()
+            line += data[counted:start].count(b'\n')
+            counted = start
+            line_start = data.rfind(b'\n', 0, start) + 1
+            line_end = data.find(b'\n', start)
+            if line_end < 0:
+                line_end = size
+            text = data[line_start:min(line_end, line_start + LINE_TEXT_CHARS)].decode('utf-8', 'replace')
+            matches.append((line, start - line_start, text))
+            if len(matches) >= max_matches:
+                break
+        return matches
+
+
+class FolderSearch:
+    '''Greps every file under a folder in a process pool and streams the
+    matches back to the Tk thread.
+
+    A thread walks the tree and hands the files to the pool in batches,
+    keeping only a few batches in flight so a huge tree neither floods
+    the pool nor holds every path in memory. Matches are collected from
+    a queue every poll_interval and passed to on_results(matches), a list
+    of (path, line, col, line text); on_done(cancelled) follows the last
+    of them. Files over max_file_bytes are skipped and counted, files at
+    least mmap_bytes long are searched through mmap, and binary files are
+    left out.
+
+    Once the folder has a trigram index, only files that changed since
+    they were indexed or hold every trigram of the query are grepped.
+    update_index() brings the index up to date in the background, on the
+    same pool.
+
+    The pool is started on the first search and kept for the next ones,
+    until shutdown(). If it cannot be used the work runs on the walking
+    thread.'''
+
+    poll_interval = 50
+    batch_files = 64
+    max_file_bytes = 16 << 20
+    mmap_bytes = 1 << 20
+    max_matches_per_file = 1000
+    # batches in flight per worker
+    batches_per_worker = 2
+    use_index = True
+
+    def __init__(self, widget, max_workers=None):
+        self.widget = widget
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.files = 0
+        self.skipped = 0
+        self.matched_files = 0
+        self.matches = 0
+        self.started = None
+        self.finished = None
+        # the index of the last folder searched, and what it made of the
+        # search, if it was used
+        self.index = None
+        self.selection = None
+        self._pool = None
+        # the search and index threads can both start the pool
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        self._cancelled = None
+        self._thread = None
+        self._results = None
+        self._poll_job = None
+        self._on_results = None
+        self._on_done = None
+        self._index_thread = None
+        self._index_cancelled = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    @property
+    def indexing(self):
+        return self._index_thread is not None and self._index_thread.is_alive()
+
+    def start(self, root, pattern, on_results, on_done):
+        '''Search root for a compiled pattern, cancelling any running
+        search.'''
+        self.cancel()
+        root = os.path.abspath(root)
+        self.files = self.skipped = self.matched_files = self.matches = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self.index = trigram_index(root) if self.use_index else None
+        self.selection = None
+        if self.index is not None and self.index.updated is not None:
+            self.selection = self.index.select(pattern)
+        self._on_results = on_results
+        self._on_done = on_done
+        self._cancelled = threading.Event()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(root, pattern, self.selection, self._cancelled, self._results),
+                                        daemon=True)
+        self._thread.start()
+        self._poll_job = self.widget.after(self.poll_interval, self._poll)
+
+    def cancel(self):
+        if self._thread is None:
+            return
+        self._cancelled.set()
+        self._thread = None
+        if self._poll_job is not None:
+            self.widget.after_cancel(self._poll_job)
+            self._poll_job = None
+        self.finished = time.perf_counter()
+        on_done, self._on_done = self._on_done, None
+        self._on_results = None
+        if on_done is not None:
+            on_done(True)
+
+    def update_index(self, root):
+        '''Bring the trigram index of root up to date on a background
+        thread, unless an update is running already.'''
+        if not self.use_index or self.indexing:
+            return
+        self._index_cancelled = threading.Event()
+        self._index_thread = threading.Thread(target=self._update_index,
+                                              args=(trigram_index(root), self._index_cancelled),
+                                              daemon=True)
+        self._index_thread.start()
+
+    def index_status(self, root):
+        '''How up to date the index of root is, for the status readout.'''
+        index = trigram_index(root)
+        stale = self.selection.stale if self.selection is not None and self.index is index else None
+        status = index.describe(stale)
+        if self.indexing:
+            status += ' (updating)'
+        return status
+
+    # stop the search and any index update, and the pool with them
+    def shutdown(self):
+        self.cancel()
+        self._index_cancelled.set()
+        with self._pool_lock:
+            self._closed = True
+        self._drop_pool()
+
+    def rate(self):
+        '''Matches found per second so far.'''
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return self.matches / elapsed if elapsed > 0 else 0.0
+
+    # on the walking thread; everything it reports goes through results
+    # as ('files', searched, skipped), ('matches', found) and ('done',)
+    def _run(self, root, pattern, selection, cancelled, results):
+        arguments = (pattern.pattern, pattern.flags, self.mmap_bytes, self.max_matches_per_file)
+
+        def batches():
+            batch = []
+            searched = skipped = 0
+            for path, info in walk_files(root, self.max_file_bytes, cancelled):
+                if info is None:
+                    skipped += 1
+                    continue
+                if selection is not None and not selection.needs(path, info):
+                    continue
+                batch.append(path)
+                searched += 1
+                if len(batch) >= self.batch_files:
+                    results.put(('files', searched, skipped))
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            results.put(('files', searched, skipped))
+
+        def handle(batch, found):
+            if found:
+                results.put(('matches', found))
+
+        try:
+            self._pool_map(grep_files, batches(), arguments, handle, cancelled)
+        finally:
+            results.put(('done',))
+
+    def _update_index(self, index, cancelled):
+        if not index.loaded:
+            index.load()
+        seen = set()
+        changed = {}
+        for path, info in walk_files(index.root, cancelled=cancelled):
+            relative = index.relative(path)
+            seen.add(relative)
+            if not index.changed(relative, info):
+                continue
+            if info.st_size > index.max_file_bytes:
+                index.add(relative, info, None)
+            else:
+                changed[path] = (relative, info)
+        removed = [relative for relative in index.files if relative not in seen]
+        for relative in removed:
+            index.remove(relative)
+        if cancelled.is_set():
+            return
+
+        paths = list(changed)
+        batches = (paths[i:i + self.batch_files] for i in range(0, len(paths), self.batch_files))
+
+        def handle(batch, found):
+            for path, keys in zip(batch, found):
+                if keys is not None:
+                    relative, info = changed[path]
+                    index.add(relative, info, keys)
+
+        self._pool_map(file_trigrams, batches, (), handle, cancelled)
+        if cancelled.is_set():
+            return
+        index.compact()
+        first = index.updated is None
+        index.updated = time.time()
+        if changed or removed or first:
+            try:
+                index.save()
+            except OSError:
+                pass
+
+    # call function(batch, *arguments) for every batch in the pool, with
+    # only a few batches in flight, and pass each batch and its result to
+    # handle on this thread
+    def _pool_map(self, function, batches, arguments, handle, cancelled):
+        pool = self._get_pool()
+        in_flight = {}
+
+        def collect():
+            done, pending = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    # the pool broke under us; do the batch here
+                    result = function(batch, *arguments)
+                handle(batch, result)
+
+        try:
+            for batch in batches:
+                if cancelled.is_set():
+                    return
+                if len(in_flight) >= self.max_workers * self.batches_per_worker:
+                    collect()
+                if pool is not None:
+                    try:
+                        in_flight[pool.submit(function, batch, *arguments)] = batch
+                        continue
+                    except (BrokenProcessPool, RuntimeError):
+                        pool = None
+                        self._drop_pool()
+                handle(batch, function(batch, *arguments))
+            while in_flight and not cancelled.is_set():
+                collect()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._closed:
+                return None
+            try:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                return self._pool
+            except (BrokenProcessPool, OSError):
+                pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return None
+
+    def _drop_pool(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _poll(self):
+        self._poll_job = None
+        found = []
+        done = False
+        while True:
+            try:
+                message = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == 'files':
+                self.files, self.skipped = message[1], message[2]
+            elif message[0] == 'matches':
+                for path, matches in message[1]:
+                    self.matched_files += 1
+                    found.extend((path, line, col, text) for line, col, text in matches)
+            else:
+                done = True
+        self.matches += len(found)
+        if found:
+            self._on_results(found)
+        if done:
+            self._thread = None
+            self.finished = time.perf_counter()
+            on_done, self._on_done = self._on_done, None
+            self._on_results = None
+            on_done(False)
+        else:
+            self._poll_job = self.widget.after(self.poll_interval, self._poll)
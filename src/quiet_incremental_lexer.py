@@ -0,0 +1,419 @@
+import copy
+import re
+
+import pygments
+from pygments.lexer import RegexLexer, ExtendedRegexLexer
+from pygments.lexers.c_cpp import CFamilyLexer
+from pygments.token import Error, Keyword, Name, Text
+from quiet_document import ASTRAL_COLUMNS, columns
+
+ROOT = ('root',)
+NEWLINE = re.compile('\n')
+# pygments.token._TokenType, without reaching into the module for it
+TOKEN_TYPE = type(Text)
+# _lex copies RegexLexer.get_tokens_unprocessed and reads the compiled
+# rules from the private RegexLexer._tokens, as they are in these pygments
+# versions; with any other version lexers go through pygments unchanged
+PYGMENTS_VERSIONS = ((2, 7), (3, 0))
+
+
+class IncrementalLexer:
+    '''Re-lexes a document from per-line lexer state checkpoints.
+
+    states[n] holds the pygments state stack at the start of line n (Tk
+    numbering, index 0 unused), or None when line n starts in the middle
+    of a token. After an edit, lexing resumes from a checkpoint at least
+    margin_lines above the edit and stops as soon as the new state at a
+    line start matches the state recorded by the previous run.
+
+    relex() only fetches a window of lines, reaching margin_lines past
+    the ones it has to settle, and widens it until the state converges,
+    so an edit costs the lines it changed rather than the whole document.
+    Checkpoints in the last margin_lines of a window are not trusted.
+    Lexing is exactly that of pygments except where a single token needs
+    to see further ahead than that: an edit can miss a token starting
+    more than margin_lines above it that only matches differently because
+    of it, such as a string left open far above and closed by the edit,
+    and a slice of the unlexed tail can stop inside a token that is
+    longer than margin_lines if it was fetched as a window.
+
+    Lines from frontier on have never been lexed; relex() can be given a
+    line budget so that tail is worked through a slice at a time.'''
+
+    # lines above an edit, or above the viewport for lex_window(), that
+    # lexing starts from
+    margin_lines = 64
+
+    def __init__(self, lexer, line_count=1):
+        self.reset(lexer, line_count)
+
+    def reset(self, lexer=None, line_count=1):
+        if lexer is not None:
+            self.lexer = lexer
+            self._remap = _token_remap(lexer)
+            self.supported = _is_supported(lexer)
+        self.states = [None, ROOT] + [None] * line_count
+        self.frontier = 1
+        self.dirty = None
+        self.tags = set()
+        self._interned = {ROOT: ROOT}
+        self._resume = None
+
+    @property
+    def line_count(self):
+        return len(self.states) - 2
+
+    @property
+    def pending(self):
+        return self.dirty is not None or self.frontier <= self.line_count
+
+    # lines start..old_end of the old document became start..new_end
+    def edit(self, start, old_end, new_end):
+        start = max(start, 1)
+        old_end = max(old_end, start)
+        new_end = max(new_end, start)
+        self.states[start + 1:old_end + 1] = [None] * (new_end - start)
+        self._resume = None
+
+        if start >= self.frontier:
+            # not lexed yet; relex() starts far enough above the frontier
+            # to pick up tokens that looked ahead into this edit
+            return
+
+        if old_end >= self.frontier:
+            self.frontier = start
+            if self.dirty is not None:
+                dirty_start, dirty_end = self.dirty
+                self.dirty = (dirty_start, min(dirty_end, start)) if dirty_start < start else None
+            return
+
+        self.frontier += new_end - old_end
+        if self.dirty is None:
+            self.dirty = (start, new_end)
+        else:
+            dirty_start, dirty_end = self.dirty
+            if dirty_end > old_end:
+                dirty_end += new_end - old_end
+            self.dirty = (min(dirty_start, start), max(dirty_end, new_end))
+
+    def relex(self, fetch, max_lines=None):
+        '''Lex the dirty region until the state converges, then the unlexed
+        tail.
+
+        fetch(first, last) must return (text, pos) where text[pos:] runs
+        from the start of line first to at least the end of line last,
+        including the text widget's final newline once last is the last
+        line. Only a window of lines is fetched, margin_lines past the
+        lines it is meant to settle, and it is widened while the state has
+        not converged by the end of what it can vouch for. With max_lines,
+        lexing pauses at the first checkpoint that many lines in and the
+        next call carries on from there. Returns (first, end, spans) where
+        lines first..end-1 need their token tags replaced by spans, or None
+        when nothing is left to lex.'''
+        if self.dirty is not None:
+            start, dirty_end = self.dirty
+        elif self.frontier <= self.line_count:
+            start = dirty_end = self.frontier
+        else:
+            return None
+        if not self.supported:
+            return self._relex_all(fetch)
+
+        if start == self._resume:
+            first = start
+        else:
+            first = max(start - self.margin_lines + 1, 1)
+            while self.states[first] is None:
+                first -= 1
+        stop = self.line_count + 1 if max_lines is None else first + max_lines
+        # the unlexed tail is settled up to stop, an edit up to its end
+        settle = stop if max_lines is not None or self.dirty is None else dirty_end
+        last = settle + self.margin_lines
+        while True:
+            result = self._relex_window(fetch, first, last, dirty_end, stop)
+            if result is not None:
+                return result
+            last += max(last - first, self.margin_lines)
+
+    # relex() with only lines first..last fetched; None, with the states
+    # left as they were, when the state has not converged by the last
+    # checkpoint the window can vouch for
+    def _relex_window(self, fetch, first, last, dirty_end, stop):
+        line_count = self.line_count
+        text, pos = fetch(first, min(last, line_count))
+        # a checkpoint only counts when the matches up to it could see
+        # margin_lines past it
+        trusted = line_count + 1 if last >= line_count else last + 1 - self.margin_lines
+        saved = self.states[first:trusted + 1]
+        prev = first
+        spans = []
+
+        for item in self._spans(text, pos, first, self._lex(text, pos, self.states[first])):
+            if item[0] is not None:
+                spans.append(item)
+                continue
+
+            checkpoint, state = item[1], item[2]
+            if checkpoint > trusted:
+                break
+            old = self.states[checkpoint] if checkpoint > prev else None
+            if checkpoint - prev > 1:
+                self.states[prev + 1:checkpoint] = [None] * (checkpoint - prev - 1)
+            self.states[checkpoint] = state
+            prev = checkpoint
+            if checkpoint > dirty_end and old == state:
+                self.dirty = None
+                return first, checkpoint, spans
+            if checkpoint >= stop and checkpoint <= line_count:
+                self._pause(checkpoint, dirty_end)
+                return first, checkpoint, spans
+        else:
+            if trusted > line_count:
+                if line_count + 1 > prev:
+                    self.states[prev + 1:] = [None] * (line_count + 1 - prev)
+                self.dirty = None
+                self.frontier = line_count + 1
+                return first, line_count + 1, spans
+
+        self.states[first:first + len(saved)] = saved
+        return None
+
+    def _pause(self, line, dirty_end):
+        if line >= self.frontier:
+            self.frontier = line
+            self.dirty = None
+        elif self.dirty is not None:
+            self.dirty = (line, max(dirty_end, line))
+        self._resume = line
+
+    def lex_window(self, fetch, first, last):
+        '''Highlight lines first..last ahead of the sequential pass.
+
+        Continues the sequential pass when the lines are close to the
+        frontier. Otherwise lexing starts a little above them from a guessed
+        root state and nothing is recorded; the sequential pass retags these
+        lines properly when it gets there. Returns
+        (first, end, spans) like relex(), or None when the lines are already
+        lexed.'''
+        line_count = self.line_count
+        last = min(last, line_count)
+        if last < self.frontier:
+            return None
+        first = max(first, 1)
+        if first - self.margin_lines <= self.frontier:
+            if self.dirty is None:
+                # close enough to just move the sequential pass along
+                return self.relex(fetch, last - self.frontier + 1)
+            begin, stack = self.frontier, self.states[self.frontier]
+        else:
+            begin, stack = first - self.margin_lines, ROOT
+        if stack is None:
+            begin, stack = first, ROOT
+
+        text, pos = fetch(begin, min(last + self.margin_lines, line_count))
+        spans = []
+        end = last + 1
+        for item in self._spans(text, pos, begin, self._lex(text, pos, stack)):
+            if item[1] > last:
+                break
+            if item[0] is not None:
+                spans.append(item)
+                end = max(end, item[3] + 1)
+        return begin, end, spans
+
+    def lex_lines(self, text, first, last, stack=ROOT):
+        '''Lex lines first..last on their own, from the given state.
+
+        text starts at line first and runs to the end of the document.
+        Returns the spans starting in those lines and the states for lines
+        first..last+1; nothing is recorded on the lexer itself.'''
+        spans = []
+        states = [stack]
+        for item in self._spans(text, 0, first, self._lex(text, 0, stack)):
+            if item[0] is not None:
+                if item[1] > last:
+                    break
+                spans.append(item)
+                continue
+            index = item[1] - first
+            if index > last + 1 - first:
+                break
+            if index >= len(states):
+                states.extend([None] * (index - len(states)))
+                states.append(item[2])
+            else:
+                states[index] = item[2]
+        states.extend([None] * (last + 2 - first - len(states)))
+        return spans, states
+
+    # copy that another thread can lex the same document with
+    def fork(self):
+        other = copy.copy(self)
+        other.states = list(self.states)
+        other.tags = set(self.tags)
+        other._interned = dict(self._interned)
+        return other
+
+    # take over what a fork lexed for lines first..end, as long as the
+    # document has not been edited since it was forked
+    def adopt(self, first, end, states, frontier, dirty, tags):
+        self.states[first:end + 1] = states
+        if frontier > self.frontier:
+            self.frontier = frontier
+        if dirty is None:
+            self.dirty = None
+        self.tags.update(tags)
+        self._resume = None
+
+    def _relex_all(self, fetch):
+        line_count = self.line_count
+        text, pos = fetch(1, line_count)
+        text = text[pos:]
+        tokens = self.lexer.get_tokens_unprocessed(text)
+        spans = [item for item in self._spans(text, 0, 1, tokens) if item[0] is not None]
+        self.dirty = None
+        self.frontier = line_count + 1
+        return 1, line_count + 1, spans
+
+    # same loop as RegexLexer.get_tokens_unprocessed, from offset pos, but
+    # it also yields (offset, None, state) whenever a token ends at the
+    # start of a line
+    def _lex(self, text, pos, stack):
+        lexer = self.lexer
+        remap = self._remap
+        interned = self._interned
+        tokendefs = lexer._tokens
+        statestack = list(stack)
+        statetokens = tokendefs[statestack[-1]]
+        length = len(text)
+
+        while True:
+            for rexmatch, action, new_state in statetokens:
+                m = rexmatch(text, pos)
+                if m:
+                    break
+            else:
+                m = None
+
+            if m:
+                if action is not None:
+                    if type(action) is TOKEN_TYPE:
+                        if remap is None:
+                            yield pos, action, m.group()
+                        else:
+                            yield pos, remap(action, m.group()), m.group()
+                    elif remap is None:
+                        yield from action(lexer, m)
+                    else:
+                        for index, token, value in action(lexer, m):
+                            yield index, remap(token, value), value
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == '#push':
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == '#push':
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                if pos and text[pos - 1] == '\n':
+                    state = tuple(statestack)
+                    yield pos, None, interned.setdefault(state, state)
+            else:
+                if pos >= length:
+                    return
+                if text[pos] == '\n':
+                    # at EOL, reset state to "root"
+                    statestack = ['root']
+                    statetokens = tokendefs['root']
+                    yield pos, Text, '\n'
+                    pos += 1
+                    yield pos, None, ROOT
+                    continue
+                yield pos, Error, text[pos]
+                pos += 1
+
+    # turn (offset, token, value) into (tag, line, col, end_line, end_col),
+    # and checkpoints into (None, line, state), where offset pos of text is
+    # the start of line. Columns are Tk's, like the Document's: shift is
+    # how many more columns than characters the line has taken up so far.
+    # Whitespace is not tagged.
+    def _spans(self, text, pos, line, items):
+        tags = self.tags
+        cur = pos
+        line_start = pos
+        shift = 0
+        for index, token, value in items:
+            if index > cur:
+                newlines = text.count('\n', cur, index)
+                if newlines:
+                    line += newlines
+                    line_start = text.rindex('\n', cur, index) + 1
+                    shift = 0
+                    cur = line_start
+                if ASTRAL_COLUMNS > 1:
+                    shift += columns(text[cur:index]) - (index - cur)
+                cur = index
+            if token is None:
+                yield None, line, value
+                continue
+            if not value or value.isspace():
+                continue
+
+            tag = str(token)
+            tags.add(tag)
+            col = index - line_start + shift
+            newlines = value.count('\n')
+            if newlines:
+                end_col = columns(value[value.rindex('\n') + 1:])
+            else:
+                end_col = col + columns(value)
+            yield tag, line, col, line + newlines, end_col
+
+
+def _is_supported(lexer):
+    if not isinstance(lexer, RegexLexer) or isinstance(lexer, ExtendedRegexLexer):
+        return False
+    if not PYGMENTS_VERSIONS[0] <= _version(pygments.__version__) < PYGMENTS_VERSIONS[1]:
+        return False
+    if isinstance(lexer, CFamilyLexer):
+        return True
+    return type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+
+
+def _version(text):
+    try:
+        return tuple(int(part) for part in text.split('.')[:2])
+    except ValueError:
+        return ()
+
+
+# CFamilyLexer post-processes plain names into Keyword.Type in its own
+# get_tokens_unprocessed, which the checkpointing loop bypasses
+def _token_remap(lexer):
+    if not isinstance(lexer, CFamilyLexer):
+        return None
+
+    type_names = set()
+    for flag, names in (('stdlibhighlighting', 'stdlib_types'),
+                        ('c99highlighting', 'c99_types'),
+                        ('c11highlighting', 'c11_atomic_types'),
+                        ('platformhighlighting', 'linux_types')):
+        if getattr(lexer, flag, False):
+            type_names.update(getattr(lexer, names, ()))
+
+    def remap(token, value):
+        if token is Name and value in type_names:
+            return Keyword.Type
+        return token
+    return remap
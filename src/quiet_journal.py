@@ -0,0 +1,321 @@
+import glob
+import os
+import queue
+import struct
+import threading
+
+from quiet_document import Document
+
+MAGIC = b'QTJ1'
+
+# record layouts after the one byte kind
+INSERT = struct.Struct('<III')      # line, col, byte length, then the text
+DELETE = struct.Struct('<IIII')     # line, col, end line, end col
+FILE = struct.Struct('<QqB')        # size, mtime_ns, strip the final newline
+LENGTH = struct.Struct('<I')
+CONTENT = struct.Struct('<Q')
+
+
+def default_journal_dir():
+    base = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'quiet-text', 'journal')
+
+
+def _encode(text):
+    return text.encode('utf-8', 'surrogatepass')
+
+
+class EditJournal:
+    '''Append-only record of the edits made to the text area, so unsaved
+    work survives a crash.
+
+    The journal starts from a checkpoint, either the full text ('C') or a
+    reference to a file on disk whose contents match the buffer ('F'),
+    followed by one small binary record per insert ('I') or delete ('D').
+    Records are buffered and flushed when the editor goes idle. Once the
+    records outgrow compact_bytes, a background thread writes a fresh
+    journal holding a checkpoint of the current text, and the edits made
+    meanwhile are appended before it replaces the old one.
+
+    While paused (a file streaming in, a read-only view) nothing is
+    recorded; the next checkpoint resumes it.'''
+
+    compact_bytes = 4 << 20
+    poll_interval = 50
+
+    def __init__(self, textarea, path=None):
+        self.textarea = textarea
+        self.directory = os.path.dirname(path) if path else default_journal_dir()
+        self.path = path or os.path.join(self.directory, 'journal-%d.bin' % os.getpid())
+        self.paused = False
+        self.filename = None
+        self._file = None
+        self._record_bytes = 0
+        self._flush_job = None
+        self._tail = None
+        # the queue the running compaction reports on, if any, and how
+        # many were started, which keeps their files apart
+        self._compaction = None
+        self._compactions = 0
+
+    # start over from a checkpoint of the whole buffer
+    def checkpoint(self, filename=None):
+        self.filename = filename
+        snapshot = self.textarea.document.snapshot()
+        self._reopen(lambda f: _write_content(f, filename, snapshot))
+
+    # start over from a file on disk that matches the buffer, which is
+    # much cheaper than copying the text; strip_newline is set when the
+    # file has the extra newline a save adds
+    def checkpoint_file(self, filename, strip_newline=False):
+        self.filename = filename
+        try:
+            info = os.stat(filename)
+        except OSError:
+            self.checkpoint(filename)
+            return
+
+        def write(f):
+            f.write(b'F')
+            _write_path(f, filename)
+            f.write(FILE.pack(info.st_size, info.st_mtime_ns, strip_newline))
+        self._reopen(write)
+
+    def insert(self, position, text):
+        data = _encode(text)
+        self._append(b'I' + INSERT.pack(position[0], position[1], len(data)) + data)
+
+    def delete(self, start, end):
+        self._append(b'D' + DELETE.pack(start[0], start[1], end[0], end[1]))
+
+    def close(self, remove=False):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        # a compaction still running finds it has been dropped
+        self._tail = None
+        self._compaction = None
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _reopen(self, write_checkpoint):
+        self.close()
+        self.paused = False
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            write_checkpoint(f)
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'ab')
+        self._record_bytes = 0
+
+    def _append(self, record):
+        if self.paused or self._file is None:
+            return
+        self._file.write(record)
+        self._record_bytes += len(record)
+        if self._tail is not None:
+            self._tail.append(record)
+        elif self._record_bytes > self.compact_bytes:
+            self._compact()
+        if self._flush_job is None:
+            self._flush_job = self.textarea.after_idle(self._flush)
+
+    def _flush(self):
+        self._flush_job = None
+        if self._file is not None:
+            self._file.flush()
+
+    def _compact(self):
+        self._tail = []
+        self._compaction = results = queue.Queue()
+        self._compactions += 1
+        snapshot = self.textarea.document.snapshot()
+        temp_path = '%s.%d.compact' % (self.path, self._compactions)
+        threading.Thread(target=self._write_compacted,
+                         args=(temp_path, self.filename, snapshot, results),
+                         daemon=True).start()
+        self.textarea.after(self.poll_interval, self._finish_compact, results)
+
+    def _write_compacted(self, temp_path, filename, snapshot, results):
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(MAGIC)
+                _write_content(f, filename, snapshot)
+            results.put(temp_path)
+        except OSError:
+            results.put(None)
+
+    def _finish_compact(self, results):
+        try:
+            temp_path = results.get_nowait()
+        except queue.Empty:
+            self.textarea.after(self.poll_interval, self._finish_compact, results)
+            return
+        if results is not self._compaction or self._file is None:
+            # closed, or a new checkpoint replaced the journal meanwhile
+            if temp_path is not None:
+                _remove(temp_path)
+            return
+        tail, self._tail = self._tail, None
+        self._compaction = None
+        if temp_path is None:
+            return
+        with open(temp_path, 'ab') as f:
+            f.writelines(tail)
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'ab')
+        self._record_bytes = sum(len(record) for record in tail)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_path(f, filename):
+    data = _encode(filename or '')
+    f.write(LENGTH.pack(len(data)))
+    f.write(data)
+
+
+# a 'C' checkpoint, streamed from the snapshot with its length patched in
+def _write_content(f, filename, snapshot):
+    f.write(b'C')
+    _write_path(f, filename)
+    length_at = f.tell()
+    f.write(CONTENT.pack(0))
+    length = 0
+    for chunk in snapshot.chunks():
+        data = _encode(chunk)
+        f.write(data)
+        length += len(data)
+    end = f.tell()
+    f.seek(length_at)
+    f.write(CONTENT.pack(length))
+    f.seek(end)
+
+
+def replay(path):
+    '''Rebuild (filename, text) from a journal, up to its last complete
+    record. Returns None if the journal is unreadable or its checkpoint
+    file has changed since.'''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        return None
+    view = memoryview(data)
+    position = 4
+    filename = None
+    document = None
+    try:
+        while position < len(data):
+            kind = data[position:position + 1]
+            position += 1
+            if kind in (b'C', b'F'):
+                size, = LENGTH.unpack_from(data, position)
+                position += LENGTH.size
+                filename = bytes(view[position:position + size]).decode('utf-8', 'surrogatepass') or None
+                position += size
+                if kind == b'C':
+                    size, = CONTENT.unpack_from(data, position)
+                    position += CONTENT.size
+                    if position + size > len(data):
+                        break
+                    document = Document(bytes(view[position:position + size]).decode('utf-8', 'surrogatepass'))
+                    position += size
+                else:
+                    file_size, mtime_ns, strip_newline = FILE.unpack_from(data, position)
+                    position += FILE.size
+                    info = os.stat(filename)
+                    if info.st_size != file_size or info.st_mtime_ns != mtime_ns:
+                        return None
+                    with open(filename, 'r') as source:
+                        text = source.read()
+                    if strip_newline and text.endswith('\n'):
+                        text = text[:-1]
+                    document = Document(text)
+            elif kind == b'I':
+                line, col, size = INSERT.unpack_from(data, position)
+                position += INSERT.size
+                if position + size > len(data):
+                    break
+                document.insert((line, col), bytes(view[position:position + size]).decode('utf-8', 'surrogatepass'))
+                position += size
+            elif kind == b'D':
+                line, col, end_line, end_col = DELETE.unpack_from(data, position)
+                position += DELETE.size
+                document.delete((line, col), (end_line, end_col))
+            else:
+                break
+    except (struct.error, OSError, UnicodeDecodeError, AttributeError):
+        # a record cut short by the crash, or a missing checkpoint file
+        if document is None:
+            return None
+    if document is None:
+        return None
+    return filename, document.text()
+
+
+def orphaned_journals(directory=None):
+    '''Journals left behind by editors that are no longer running, newest
+    first.'''
+    directory = directory or default_journal_dir()
+    journals = []
+    for path in glob.glob(os.path.join(directory, 'journal-*.bin')):
+        try:
+            pid = int(os.path.basename(path)[len('journal-'):-len('.bin')])
+        except ValueError:
+            continue
+        if pid == os.getpid() or _is_running(pid):
+            continue
+        journals.append((os.path.getmtime(path), path))
+    journals.sort(reverse=True)
+    return [path for mtime, path in journals]
+
+
+def _is_running(pid):
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows
+        return _is_running_windows(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+ERROR_ACCESS_DENIED = 5
+STILL_ACTIVE = 259
+
+
+def _is_running_windows(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    kernel32.GetExitCodeProcess.argtypes = (wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD))
+    kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # a process we may not look at is still a process
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+    try:
+        code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+            return True
+        return code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
@@ -0,0 +1,282 @@
+import mmap
+import threading
+import tkinter as tk
+from tkinter import messagebox
+from array import array
+from bisect import bisect_left
+
+
+class LineIndex:
+    '''Sparse line index over a memory-mapped file.
+
+    A background thread counts the newlines in each block of block_size
+    bytes, so the index holds one number per block rather than one per
+    line. Finding a line means jumping to its block and scanning forward
+    from there.'''
+
+    block_size = 1 << 18
+
+    def __init__(self, mm):
+        self.mm = mm
+        self.size = len(mm)
+        # newlines before the start of each block scanned so far
+        self.lines_before = array('q', [0])
+        self.complete = False
+        self._cancelled = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._build, daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _build(self):
+        mm = self.mm
+        block = self.block_size
+        newlines = 0
+        position = 0
+        try:
+            while position < self.size and not self._cancelled.is_set():
+                newlines += mm[position:position + block].count(b'\n')
+                position += block
+                if position < self.size:
+                    self.lines_before.append(newlines)
+        except ValueError:
+            # the map was closed under us
+            return
+        self.complete = not self._cancelled.is_set()
+
+    @property
+    def indexed_lines(self):
+        '''Lines known to start inside the blocks scanned so far.'''
+        if self.complete:
+            return self.line_count
+        return self.lines_before[-1] + 1
+
+    @property
+    def line_count(self):
+        '''Lines in the file, or an estimate while the index is being built.'''
+        scanned = len(self.lines_before) - 1
+        if not self.complete:
+            if not scanned:
+                return max(1, self.mm[:self.block_size].count(b'\n') * self.size // self.block_size)
+            return self.lines_before[-1] * self.size // (scanned * self.block_size)
+        newlines = self.lines_before[-1] + self.mm[scanned * self.block_size:].count(b'\n')
+        return newlines if self.size and self.mm[-1:] == b'\n' else newlines + 1
+
+    def offset_of(self, line):
+        '''Byte offset where line (1-based) starts, or the file size past
+        the last line.'''
+        wanted = line - 1
+        if wanted <= 0:
+            return 0
+        lines_before = self.lines_before
+        i = max(bisect_left(lines_before, wanted) - 1, 0)
+        position = i * self.block_size
+        remaining = wanted - lines_before[i]
+        # skip whole blocks past the end of the index, then walk the lines
+        while position < self.size:
+            chunk = self.mm[position:position + self.block_size]
+            newlines = chunk.count(b'\n')
+            if newlines < remaining:
+                remaining -= newlines
+                position += self.block_size
+                continue
+            found = -1
+            for _ in range(remaining):
+                found = chunk.find(b'\n', found + 1)
+            return position + found + 1
+        return self.size
+
+    def line_at(self, offset):
+        '''Line (1-based) containing the byte at offset.'''
+        i = min(offset // self.block_size, len(self.lines_before) - 1)
+        position = i * self.block_size
+        newlines = self.lines_before[i]
+        while position < offset:
+            end = min(position + self.block_size, offset)
+            newlines += self.mm[position:end].count(b'\n')
+            position = end
+        return newlines + 1
+
+
+class LargeFileView:
+    '''Read-only view of a file too large for the text widget.
+
+    The file is memory-mapped and only a page of page_lines lines around
+    the viewport lives in the widget. Scrolling near either edge of the
+    page loads the next one; the scrollbar, the line numbers, go-to-line
+    and find all work in real file lines.'''
+
+    page_lines = 2000
+    # lines left above or below the viewport before the page moves
+    page_margin = 300
+    # cap on the bytes paged in, for files with enormous lines
+    max_page_bytes = 8 << 20
+    # lines shown above a find match
+    find_context = 5
+    # ms between checks on the index while a goto waits for it
+    goto_poll = 100
+    encoding = 'utf-8'
+
+    def __init__(self, parent):
+        self._parent = parent
+        self.textarea = parent.textarea
+        self.active = False
+        self.path = None
+        self.index = None
+        self.page_top = 1
+        self.page_end = 1
+        self._file = None
+        self._mm = None
+        self._paging = False
+        self._find_offset = 0
+        # line waiting for the index to get to it, and the job polling
+        self._pending_goto = None
+        self._goto_job = None
+
+    def open(self, path):
+        '''Map path and show its first page.
+
+        Raises OSError or ValueError when the file cannot be mapped, such
+        as when it is empty; it has to be loaded normally then.'''
+        self.close()
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._file.close()
+            self._file = None
+            raise
+        self.path = path
+        self.active = True
+        self.index = LineIndex(self._mm)
+        self.index.start()
+        self._find_offset = 0
+
+        self.textarea.large_file = self
+        self.textarea.configure(yscrollcommand=self._on_text_scroll, undo=False)
+        self._parent.scrolly.configure(command=self.yview)
+        self.show(1)
+
+    def close(self):
+        if not self.active:
+            return
+        self.active = False
+        self._cancel_goto()
+        self.index.cancel()
+        self.textarea.large_file = None
+        self.textarea.configure(state='normal', undo=True,
+                                yscrollcommand=self._parent.scrolly.set)
+        self._parent.scrolly.configure(command=self.textarea.yview)
+        self.textarea.delete(1.0, tk.END)
+        self.textarea.edit_reset()
+        self._parent.linenumbers.line_offset = 0
+        self._mm.close()
+        self._file.close()
+        self._mm = self._file = None
+
+    # load the page around line and scroll it to the top of the view
+    def show(self, line, row=0):
+        line = min(max(line, 1), self.index.line_count)
+        top = max(1, line - self.page_lines // 3)
+        start = self.index.offset_of(top)
+        end = min(self.index.offset_of(top + self.page_lines), start + self.max_page_bytes)
+        page = self._mm[start:end].decode(self.encoding, 'replace')
+        if page.endswith('\n'):
+            page = page[:-1]
+
+        self._paging = True
+        try:
+            self.page_top = top
+            self.page_end = top + page.count('\n')
+            self._parent.linenumbers.line_offset = top - 1
+            self.textarea.configure(state='normal')
+            self.textarea.delete(1.0, tk.END)
+            self.textarea.insert(1.0, page)
+            self.textarea.configure(state='disabled')
+            self.textarea.yview('%d.0' % max(line - top - row + 1, 1))
+        finally:
+            self._paging = False
+
+    def goto(self, line):
+        '''Put the cursor on line, once the index has got that far.
+
+        The line count is only an estimate while the index is being built,
+        so a line past what has been scanned waits for it.'''
+        self._cancel_goto()
+        if line > self.index.indexed_lines:
+            self._pending_goto = line
+            self._parent.statusbar.display_status_message('Indexing... going to line %d when it is reached.' % line,
+                                                          msg_type='hint')
+            self._goto_job = self.textarea.after(self.goto_poll, self._poll_goto)
+            return
+        line = min(max(line, 1), self.index.line_count)
+        self.show(line)
+        self.textarea.mark_set(tk.INSERT, '%d.0' % (line - self.page_top + 1))
+
+    def _poll_goto(self):
+        self._goto_job = None
+        if self._pending_goto > self.index.indexed_lines:
+            self._goto_job = self.textarea.after(self.goto_poll, self._poll_goto)
+            return
+        self.goto(self._pending_goto)
+
+    def _cancel_goto(self):
+        self._pending_goto = None
+        if self._goto_job is not None:
+            self.textarea.after_cancel(self._goto_job)
+            self._goto_job = None
+
+    # first and last file lines in the viewport
+    def visible_lines(self):
+        first = int(self.textarea.index('@0,0').split('.')[0])
+        last = int(self.textarea.index('@0,%d' % self.textarea.winfo_height()).split('.')[0])
+        return first + self.page_top - 1, last + self.page_top - 1
+
+    def _on_text_scroll(self, first_fraction, last_fraction):
+        if self._paging:
+            return
+        first, last = self.visible_lines()
+        if ((self.page_top > 1 and first - self.page_top < self.page_margin) or
+                (self.page_end < self.index.line_count and self.page_end - last < self.page_margin)):
+            self.show(first)
+            first, last = self.visible_lines()
+
+        line_count = max(self.index.line_count, 1)
+        self._parent.scrolly.set((first - 1) / line_count, last / line_count)
+
+    # scrollbar commands, in whole-file terms
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            self.show(int(float(args[1]) * self.index.line_count) + 1)
+        else:
+            self.textarea.yview(*args)
+
+    def find(self, text_to_find):
+        '''Find the next match after the last one, straight from the map.'''
+        needle = text_to_find.encode(self.encoding)
+        if not needle:
+            return
+        offset = self._mm.find(needle, self._find_offset)
+        if offset < 0:
+            if self._find_offset and messagebox.askyesno(
+                    "No more results", "No further matches. Repeat from the beginning?"):
+                self._find_offset = 0
+                return self.find(text_to_find)
+            if not self._find_offset:
+                messagebox.showinfo("No Matches", "No matching text found")
+            return
+
+        line = self.index.line_at(offset)
+        column = len(self._mm[self.index.offset_of(line):offset].decode(self.encoding, 'replace'))
+        self._find_offset = offset + len(needle)
+        self.show(line, row=self.find_context)
+        index = '%d.%d' % (line - self.page_top + 1, column)
+        self.textarea.tag_remove('find_match', 1.0, tk.END)
+        self.textarea.tag_add('find_match', index, '%s+%dc' % (index, len(text_to_find)))
+        self.textarea.mark_set(tk.INSERT, index)
+
+    def cancel_find(self):
+        self._find_offset = 0
+        self.textarea.tag_remove('find_match', 1.0, tk.END)
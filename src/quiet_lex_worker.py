@@ -0,0 +1,134 @@
+import queue
+import threading
+
+from quiet_incremental_lexer import NEWLINE
+from quiet_parallel_lexer import ParallelLexer
+from quiet_token_cache import TokenCache
+
+
+class LexWorker:
+    '''Lexes a snapshot of the document on a background thread.
+
+    The thread works on a fork of the editor's IncrementalLexer and queues
+    one batch per slice of lines. The main thread drains them with
+    batches() and throws them away once the document has moved on from the
+    revision the snapshot was taken at.
+
+    Whole-document results are kept in a TokenCache, so reopening a file
+    that was lexed before skips pygments altogether.'''
+
+    batch_lines = 2000
+
+    def __init__(self):
+        self.results = queue.Queue()
+        self.job = 0
+        self.revision = None
+        self.running = False
+        self._cancelled = threading.Event()
+        self.parallel = ParallelLexer()
+        self.cache = TokenCache()
+
+    # lex a snapshot of the CustomText document taken at revision
+    def start(self, incremental, document, revision):
+        self.cancel()
+        self.revision = revision
+        self.running = True
+        self._cancelled = threading.Event()
+        thread = threading.Thread(target=self._run,
+                                  args=(self.job, incremental.fork(), document, revision, self._cancelled),
+                                  daemon=True)
+        thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+        self.job += 1
+        self.running = False
+
+    # batches of the current job as
+    # (revision, first, end, spans, states, frontier, dirty, tags)
+    def batches(self):
+        while True:
+            try:
+                job, batch = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if job != self.job:
+                continue
+            if batch is None:
+                self.running = False
+                return
+            yield batch
+
+    def _run(self, job, lexer, document, revision, cancelled):
+        # the same text as Text.get('1.0', 'end'), joined off the Tk thread
+        text = document.text() + '\n'
+        offsets = [0]
+        offsets.extend(m.end() for m in NEWLINE.finditer(text))
+
+        def fetch(first, last):
+            return text, offsets[first - 1]
+
+        try:
+            key = cached = None
+            # entries hold whole documents, so the cache is only looked at
+            # while no more than the first batch is lexed, as when a file
+            # was just opened; a restart after an edit carries on from the
+            # frontier instead of hashing the text and lexing it again
+            if (self.cache is not None and lexer.supported and lexer.dirty is None
+                    and lexer.frontier <= self.batch_lines):
+                key = self.cache.key(text, lexer.lexer)
+                cached = self.cache.load(key, offsets)
+                if cached is None and lexer.frontier > 1:
+                    # start over from line 1 so the batches add up to a
+                    # whole document worth storing
+                    lexer.reset(line_count=lexer.line_count)
+
+            if cached is not None:
+                spans, lexer.states, tags = cached
+                lexer.frontier = lexer.line_count + 1
+                lexer.tags.update(tags)
+            # relexing the few lines already done is cheaper than stitching
+            elif (lexer.supported and lexer.dirty is None
+                    and lexer.line_count - lexer.frontier >= self.parallel.threshold_lines):
+                spans = self.parallel.lex(lexer, text, offsets)
+            else:
+                spans = None
+
+            if spans is not None:
+                for first, end, batch in _slices(spans, lexer.states, self.batch_lines):
+                    if cancelled.is_set():
+                        return
+                    self.results.put((job, (revision, first, end, batch, lexer.states[first:end + 1],
+                                            end, None, set(lexer.tags))))
+                if cached is None and key is not None:
+                    self.cache.store(key, offsets, spans, lexer.states)
+                return
+
+            collected = [] if key is not None else None
+            while lexer.pending and not cancelled.is_set():
+                first, end, spans = lexer.relex(fetch, self.batch_lines)
+                if collected is not None:
+                    collected.extend(spans)
+                self.results.put((job, (revision, first, end, spans, lexer.states[first:end + 1],
+                                        lexer.frontier, lexer.dirty, set(lexer.tags))))
+            if collected is not None and not lexer.pending:
+                self.cache.store(key, offsets, collected, lexer.states)
+        finally:
+            self.results.put((job, None))
+
+
+# cut a fully lexed document into batches that end on line checkpoints,
+# so no token is split between two of them
+def _slices(spans, states, batch_lines):
+    line_count = len(states) - 2
+    first = 1
+    i = 0
+    while first <= line_count:
+        end = min(first + batch_lines, line_count + 1)
+        while end <= line_count and states[end] is None:
+            end += 1
+        j = i
+        while j < len(spans) and spans[j][1] < end:
+            j += 1
+        yield first, end, spans[i:j]
+        first, i = end, j
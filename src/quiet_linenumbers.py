@@ -7,30 +7,84 @@ class TextLineNumbers(tk.Canvas):
         self._parent = parent
         self.textwidget = parent.textarea
         self.font_color = parent.menu_fg
+        # canvas text items are reused between redraws; _shown holds the
+        # (line number, y) each one currently displays
+        self._items = []
+        self._shown = []
+        self._view = None
+        self._style = None
+        self._width = None
+        # added to every number, for views that hold only part of a file
+        self.line_offset = 0
 
     def attach(self, text_widget):
         self.textwidget = text_widget
+        self._view = None
 
     def redraw(self, *args):
         '''redraw line numbers'''
         if not self.visible:
             return
 
-        self.delete('all')
-        self.config(width=(self._parent.font_size * 3),
-                    bd=0)
-
-        i = self.textwidget.index('@0,0')
-        while True :
-            dline= self.textwidget.dlineinfo(i)
-            if dline is None: break
-            y = dline[1]
-            linenum = str(i).split('.')[0]
-            self.create_text(2, y, anchor='nw',
-                             text=linenum,
-                             font=(self._text_font, self._parent.font_size),
-                             fill=self.font_color)
-            i = self.textwidget.index('%s+1line' % i)
+        text = self.textwidget
+        first = text.index('@0,0')
+        line_count = int(text.index('end-1c').split('.')[0])
+        # the top line's offset catches pixel scrolling, the insert line's
+        # height catches typing that changes how far it wraps, and where
+        # the last visible line sits catches a wrap change on any other
+        last = text.index('@0,%d' % text.winfo_height())
+        view = (first, line_count, text.dlineinfo(first), text.dlineinfo('insert'),
+                last, text.dlineinfo(last), self.winfo_height(), self.line_offset)
+        style = ((self._text_font, self._parent.font_size), self.font_color)
+        if view == self._view and style == self._style:
+            return
+        self._view = view
+
+        # room for the digits of the numbers a large file view can reach
+        width = self._parent.font_size * max(3, len(str(line_count + self.line_offset)) - 1)
+        if width != self._width:
+            self._width = width
+            self.config(width=width, bd=0)
+        if style != self._style:
+            self._style = style
+            for item in self._items:
+                self.itemconfigure(item, font=style[0], fill=style[1])
+
+        count = 0
+        line = int(first.split('.')[0])
+        while line <= line_count:
+            dline = text.dlineinfo('%d.0' % line)
+            if dline is None:
+                break
+            self._place(count, line + self.line_offset, dline[1])
+            count += 1
+            line += 1
+
+        for i in range(count, len(self._items)):
+            if self._shown[i] is not None:
+                self.itemconfigure(self._items[i], state='hidden')
+                self._shown[i] = None
+
+    # show line number linenum at y using the count-th pooled item
+    def _place(self, count, linenum, y):
+        if count == len(self._items):
+            font, fill = self._style
+            self._items.append(self.create_text(2, y, anchor='nw', text=str(linenum),
+                                                font=font, fill=fill))
+            self._shown.append((linenum, y))
+            return
+
+        item = self._items[count]
+        shown = self._shown[count]
+        if shown is None:
+            self.itemconfigure(item, state='normal', text=str(linenum))
+            self.coords(item, 2, y)
+        else:
+            if shown[0] != linenum:
+                self.itemconfigure(item, text=str(linenum))
+            if shown[1] != y:
+                self.coords(item, 2, y)
+        self._shown[count] = (linenum, y)
 
     @property
     def visible(self):
@@ -44,4 +98,8 @@ class TextLineNumbers(tk.Canvas):
             self.redraw()
         else:
             self.delete('all')
+            self._items = []
+            self._shown = []
+            self._view = None
+            self._width = 0
             self.config(width=0)
@@ -1,4 +1,215 @@
-import yaml
+import atexit
+import copy
+import os
+import pickle
+
+
+class SettingsStore:
+	'''One in-memory copy of a YAML settings file shared by the whole editor.
+
+	The file is parsed again only when its mtime, size or inode change.
+	Updates land in memory straight away, notify subscribers with the set
+	of keys that changed, and reach the disk after write_delay ms of quiet
+	(or right away before a widget is attached, and at exit).'''
+
+	write_delay = 500
+
+	def __init__(self, path):
+		self.path = path
+		self.subscribers = []
+		self._data = None
+		self._stamp = None
+		self._dirty = False
+		self._widget = None
+		self._write_job = None
+
+	# widget whose after() schedules the debounced writes
+	def attach(self, widget):
+		self._widget = widget
+
+	def subscribe(self, callback):
+		'''Call callback(changed_keys) whenever values change, whether
+		through update() or because the file was edited on disk.'''
+		self.subscribers.append(callback)
+
+	def get(self):
+		if not self._dirty:
+			stamp = self._file_stamp()
+			if stamp != self._stamp:
+				self._stamp = stamp
+				self._replace(load_config(self.path))
+		return dict(self._data)
+
+	def update(self, new_settings):
+		self.get()
+		self._replace(dict(new_settings))
+		self._dirty = True
+		if self._widget is None:
+			self.flush()
+		else:
+			if self._write_job is not None:
+				self._widget.after_cancel(self._write_job)
+			self._write_job = self._widget.after(self.write_delay, self.flush)
+
+	# the file was just written by someone else, e.g. saved from the
+	# editor: its contents win over updates not written yet
+	def reload(self):
+		if self._write_job is not None:
+			self._widget.after_cancel(self._write_job)
+			self._write_job = None
+		self._dirty = False
+		self._stamp = None
+		return self.get()
+
+	def flush(self):
+		self._write_job = None
+		if not self._dirty:
+			return
+		with open(self.path, 'w') as settings_config:
+			yaml, loader, dumper = _yaml()
+			yaml.dump(self._data, settings_config, Dumper=dumper)
+		self._dirty = False
+		self._stamp = self._file_stamp()
+		# what was written is what the next start would parse
+		_remember(self.path, self._stamp, copy.deepcopy(self._data))
+
+	def _replace(self, data):
+		old = self._data
+		self._data = data
+		if old is None:
+			return
+		changed = {key for key in old.keys() | data.keys() if old.get(key) != data.get(key)}
+		if changed:
+			for callback in list(self.subscribers):
+				callback(changed)
+
+	def _file_stamp(self):
+		try:
+			return _stamp(self.path)
+		except OSError:
+			return None
+
+
+def default_snapshot_path():
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	return os.path.join(base, 'quiet-text', 'config.pickle')
+
+
+class ConfigSnapshot:
+	'''Every parsed config file (settings, themes, syntaxes) pickled together
+	into one file, so a start with unchanged configs reads a single file
+	instead of parsing YAML.
+
+	Each entry keeps the mtime, size and inode of its source file and is
+	only used while they still match. The snapshot is rewritten by save()
+	when entries were added.'''
+
+	version = 1
+
+	def __init__(self, path=None):
+		self.path = path or default_snapshot_path()
+		self.dirty = False
+		self._entries = None
+
+	def get(self, config_path, stamp):
+		entry = self._load().get(os.path.abspath(config_path))
+		if entry is not None and entry[0] == stamp:
+			return entry[1]
+		return None
+
+	def put(self, config_path, stamp, data):
+		self._load()[os.path.abspath(config_path)] = (stamp, data)
+		self.dirty = True
+
+	def save(self):
+		if not self.dirty:
+			return
+		try:
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+			temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+			with open(temp_path, 'wb') as f:
+				pickle.dump((self.version, self._entries), f, pickle.HIGHEST_PROTOCOL)
+			os.replace(temp_path, self.path)
+		except OSError as e:
+			print(e)
+			return
+		self.dirty = False
+
+	def _load(self):
+		if self._entries is None:
+			self._entries = {}
+			try:
+				with open(self.path, 'rb') as f:
+					version, entries = pickle.load(f)
+				if version == self.version:
+					self._entries = entries
+			except Exception:
+				# missing, from an older editor or damaged: start over
+				pass
+		return self._entries
+
+
+# parsed config files, reloaded when they change on disk
+_configs = {}
+_stores = {}
+_snapshot = ConfigSnapshot()
+
+
+# PyYAML is imported only once a config has to be parsed or written, which
+# a start served from the snapshot never does. libyaml's loader and dumper
+# are several times faster when PyYAML was built with it.
+def _yaml():
+	import yaml
+	try:
+		return yaml, yaml.CFullLoader, yaml.CDumper
+	except AttributeError:
+		return yaml, yaml.FullLoader, yaml.Dumper
+
+
+def _stamp(path):
+	info = os.stat(path)
+	return info.st_mtime_ns, info.st_size, info.st_ino
+
+
+def load_config(path):
+	'''Parsed contents of a YAML config file, from memory or the snapshot
+	while the file is unchanged.'''
+	stamp = _stamp(path)
+	cached = _configs.get(path)
+	if cached is None or cached[0] != stamp:
+		data = _snapshot.get(path, stamp)
+		if data is None:
+			yaml, loader, dumper = _yaml()
+			with open(path, 'r') as some_config:
+				data = yaml.load(some_config, Loader=loader)
+			_snapshot.put(path, stamp, data)
+		cached = _configs[path] = (stamp, data)
+	# callers are free to modify what they get back
+	return copy.deepcopy(cached[1])
+
+
+def _remember(path, stamp, data):
+	if stamp is not None:
+		_configs[path] = (stamp, data)
+		_snapshot.put(path, stamp, data)
+
+
+def save_config_snapshot():
+	_snapshot.save()
+
+
+def settings_store(path):
+	store = _stores.get(path)
+	if store is None:
+		store = _stores[path] = SettingsStore(path)
+	return store
+
+
+@atexit.register
+def _flush_settings():
+	for store in _stores.values():
+		store.flush()
+	_snapshot.save()
 
 
 class QuietLoaders:
@@ -11,42 +222,29 @@ class QuietLoaders:
 		self.python3_syntax_path = 'syntax_configs/python3.yaml'
 		self.javascript_syntax_path = 'syntax_configs/javascript.yaml'
 		self.c_syntax_path = 'syntax_configs/c.yaml'
+		self.settings = settings_store(self.settings_path)
 
 
 	def load_settings_data(self, default=False):
 		if not default:
-			with open(self.settings_path, 'r') as some_config:
-				return yaml.load(some_config, Loader=yaml.FullLoader)
+			return self.settings.get()
 		else:
-			with open(self.default_settings_path, 'r') as some_config:
-				return yaml.load(some_config, Loader=yaml.FullLoader)
+			return load_config(self.default_settings_path)
 
 	def store_settings_data(self, new_settings):
-		with open(self.settings_path, 'w') as settings_config:
-			yaml.dump(new_settings, settings_config)
+		self.settings.update(new_settings)
 
 	def load_default_theme(self):
-		with open(self.default_theme_path, 'r') as some_config:
-			return yaml.load(some_config, Loader=yaml.FullLoader)
+		return load_config(self.default_theme_path)
 
 	def load_default_syntax(self):
-		with open(self.default_syntax_path, 'r') as some_config:
-			return yaml.load(some_config, Loader=yaml.FullLoader)
+		return load_config(self.default_syntax_path)
 
 	def load_python3_syntax(self):
-		with open(self.python3_syntax_path, 'r') as some_config:
-			return yaml.load(some_config, Loader=yaml.FullLoader)
+		return load_config(self.python3_syntax_path)
 
 	def load_javascript_syntax(self):
-		with open(self.javascript_syntax_path, 'r') as some_config:
-			return yaml.load(some_config, Loader=yaml.FullLoader)
+		return load_config(self.javascript_syntax_path)
 
 	def load_c_syntax(self):
-		with open(self.c_syntax_path, 'r') as some_config:
-			return yaml.load(some_config, Loader=yaml.FullLoader)
-
-
-
-
-
-
+		return load_config(self.c_syntax_path)
@@ -1,7 +1,4 @@
 import tkinter as tk
-import yaml
-from tkinter.colorchooser import askcolor
-from quiet_syntax_highlighting import SyntaxHighlighting
 from quiet_loaders import QuietLoaders
 
 class Menu(tk.Menu):
@@ -58,6 +55,10 @@ class Menubar:
         file_dropdown.add_command(label='Open File',
                                    accelerator='Ctrl+O',
                                    command=parent.open_file)
+        # open a file by part of its path
+        file_dropdown.add_command(label='Quick Open',
+                                   accelerator='Ctrl+P',
+                                   command=parent.show_quick_open)
         # save file feature
         file_dropdown.add_command(label='Save',
                                    accelerator='Ctrl+S',
@@ -110,6 +111,10 @@ class Menubar:
                                    accelerator='Ctrl+R',
                                    command=parent.run)
 
+        tools_dropdown.add_command(label='Find in Folder',
+                                   accelerator='Ctrl+Shift+F',
+                                   command=parent.show_find_folder_window)
+
         #theme dropdown menu
         theme_dropdown = Menu(menubar, font=font_specs, tearoff=0)
         theme_dropdown.add_command(label='Monokai',
@@ -170,6 +175,7 @@ class Menubar:
 
     # color to different text tye can be set here
     def open_color_picker(self):
+        from tkinter.colorchooser import askcolor
         return askcolor(title='Color Menu', initialcolor='#d5c4a1')[1]
 
     def toggle_text_border(self):
@@ -181,7 +187,7 @@ class Menubar:
           self._parent.textarea.configure(bd=0.5)
           settings['textarea_border'] = 0.5
         self.border_on = not self.border_on
-        self._parent.store_settings_data(settings)
+        self._parent.loader.store_settings_data(settings)
 
     # quiet mode is defined here
     def enter_quiet_mode(self):
@@ -0,0 +1,152 @@
+import bisect
+import multiprocessing
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pygments.lexers import get_lexer_by_name
+from quiet_incremental_lexer import IncrementalLexer, ROOT
+
+# a blank line followed by an unindented one, where a lexer is usually
+# back in its root state
+BOUNDARY = re.compile(r'\n[ \t]*\n(?=\S)')
+
+# lexers already built in a pool process, by alias
+_lexers = {}
+
+
+class ParallelLexer:
+    '''Lexes very large documents in a process pool.
+
+    The document is cut at top-level blank lines and every chunk is lexed
+    on its own from the root state, from a slice of the text that runs
+    margin_lines past its end so matches there can look ahead. Where the state really reaching a cut
+    turns out not to be root (the cut fell inside a string or comment), the
+    lines after it are re-lexed in this process until the state converges
+    with the chunk's own result, like after an edit.'''
+
+    # documents with fewer lines are lexed in a single process
+    threshold_lines = 200000
+    chunks_per_worker = 2
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = None
+
+    def lex(self, incremental, text, offsets):
+        '''Fully lex text with the given IncrementalLexer, which is left
+        with every line state filled in. offsets[n] is where line n+1
+        starts. Returns the spans of the whole document in order, or None
+        when the pool could not be used and nothing was changed.'''
+        line_count = incremental.line_count
+        alias = incremental.lexer.aliases[0]
+
+        starts = self.split(text, offsets, line_count)
+        ends = [start - 1 for start in starts[1:]] + [line_count]
+        # a chunk only gets the lines matches near its end can look
+        # ahead into, not the rest of the document
+        overlap = incremental.margin_lines
+        chunks = [text[offsets[start - 1]:offsets[min(end + overlap, line_count)]]
+                  for start, end in zip(starts, ends)]
+
+        try:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            results = list(self._pool.map(_lex_chunk, [alias] * len(chunks), chunks, starts, ends))
+        except (BrokenProcessPool, OSError):
+            self.shutdown()
+            return None
+
+        spans = []
+        chunk_end_states = []
+        for start, end, (tags, packed, states) in zip(starts, ends, results):
+            spans.extend(_unpack(tags, packed))
+            incremental.states[start:end + 1] = states[:-1]
+            incremental.tags.update(tags)
+            chunk_end_states.append((end + 1, states[-1]))
+
+        # the state each chunk reached at the next cut is the real one as
+        # long as the chunk itself started from the right state
+        for line, state in chunk_end_states[:-1]:
+            incremental.states[line] = state
+        incremental.states[line_count + 1] = chunk_end_states[-1][1]
+        incremental.frontier = line_count + 1
+        incremental.dirty = None
+
+        def fetch(first, last):
+            return text, offsets[first - 1]
+
+        repairs = []
+        repaired_until = 0
+        for line, state in chunk_end_states[:-1]:
+            if line < repaired_until or state == ROOT:
+                continue
+            incremental.dirty = (line, line)
+            first, end, fixed = incremental.relex(fetch)
+            repairs.append((first, end, fixed))
+            repaired_until = end
+
+        for first, end, fixed in reversed(repairs):
+            lo = _first_span_at(spans, first)
+            hi = _first_span_at(spans, end)
+            spans[lo:hi] = fixed
+        return spans
+
+    # first line of every chunk, cut at the boundary closest to each share
+    def split(self, text, offsets, line_count):
+        chunk_count = self.max_workers * self.chunks_per_worker
+        step = len(text) // chunk_count
+        starts = [1]
+        for i in range(1, chunk_count):
+            m = BOUNDARY.search(text, max(i * step, offsets[starts[-1]]))
+            if m is None:
+                break
+            line = bisect.bisect_right(offsets, m.end())
+            if line <= starts[-1] or line > line_count:
+                continue
+            starts.append(line)
+        return starts
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+# runs in a pool process; spans come back packed in an array of
+# (tag id, line, col, end line, end col) to keep pickling cheap
+def _lex_chunk(alias, text, first, last):
+    incremental = _lexers.get(alias)
+    if incremental is None:
+        incremental = _lexers[alias] = IncrementalLexer(get_lexer_by_name(alias))
+    spans, states = incremental.lex_lines(text, first, last)
+
+    tags = []
+    tag_ids = {}
+    packed = array('l')
+    for tag, line, col, end_line, end_col in spans:
+        tag_id = tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = tag_ids[tag] = len(tags)
+            tags.append(tag)
+        packed.extend((tag_id, line, col, end_line, end_col))
+    return tags, packed, states
+
+
+def _unpack(tags, packed):
+    for i in range(0, len(packed), 5):
+        yield tags[packed[i]], packed[i + 1], packed[i + 2], packed[i + 3], packed[i + 4]
+
+
+def _first_span_at(spans, line):
+    lo, hi = 0, len(spans)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if spans[mid][1] < line:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
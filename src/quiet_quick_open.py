@@ -0,0 +1,137 @@
+import os
+import tkinter as tk
+import tkinter.ttk as ttk
+
+from quiet_file_list import FuzzySearch, file_list
+
+
+class QuickOpenWindow(tk.Toplevel):
+    '''Opens a file of the working directory by typing part of its path.
+
+    The file list is cached per folder and refreshed in the background
+    every time the window opens; the previous list is searched until the
+    new one is ready.'''
+
+    max_listed = 50
+    # scoring time per frame while a search runs
+    frame_budget = 0.012
+    poll_interval = 100
+
+    def __init__(self, master, editor, root=None, **kwargs):
+        super().__init__(**kwargs)
+
+        self.master = master
+        self.editor = editor
+        self.files = file_list(root or os.getcwd())
+        self.files.refresh_in_background()
+        self.search = None
+        self.results = []
+        self._search_job = None
+        self._poll_job = None
+
+        self.geometry('600x340')
+        self.title('Quick Open')
+        self.transient(self.master)
+        self.configure(bg=self.master.bg_color)
+
+        self.query = tk.StringVar()
+
+        top_frame = tk.Frame(self, bg=self.master.bg_color)
+        list_frame = tk.Frame(self, bg=self.master.bg_color)
+
+        self.query_entry = ttk.Entry(top_frame, textvar=self.query)
+        # how many files match, or that the list is still being made
+        self.status_label = ttk.Label(top_frame, width=18, anchor=tk.E, style="editor.TLabel")
+        self.result_list = tk.Listbox(list_frame, activestyle='none', bd=0, highlightthickness=0,
+                                      bg=self.master.bg_color, fg=self.master['fg'],
+                                      selectbackground=self.master['selectbackground'],
+                                      font=self.master['font'])
+
+        self.query_entry.pack(side=tk.LEFT, fill=tk.X, expand=1)
+        self.status_label.pack(side=tk.LEFT, padx=(10, 0))
+        self.result_list.pack(side=tk.TOP, fill='both', expand=1)
+
+        top_frame.pack(side=tk.TOP, fill=tk.X, padx=20, pady=(10, 5))
+        list_frame.pack(side=tk.TOP, fill='both', expand=1, padx=20, pady=(0, 10))
+
+        self.query_entry.focus_force()
+        self.query_entry.bind('<Return>', self.on_open)
+        self.query_entry.bind('<Down>', lambda event: self.move_selection(1))
+        self.query_entry.bind('<Up>', lambda event: self.move_selection(-1))
+        self.result_list.bind('<Double-Button-1>', self.on_open)
+        self.result_list.bind('<Return>', self.on_open)
+        self.bind('<Escape>', lambda event: self.on_close())
+        self.query.trace_add('write', lambda *args: self.start_search())
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.minsize(400, 200)
+        self.start_search()
+        self._poll_job = self.after(self.poll_interval, self.poll_file_list)
+
+    def start_search(self):
+        matcher = self.files.matcher
+        if matcher is None:
+            self.status_label.configure(text='Listing files...')
+            return
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+            self._search_job = None
+        self.search = FuzzySearch(matcher, self.query.get(), self.max_listed, previous=self.search)
+        self.continue_search()
+
+    # one frame's worth of scoring, then show the best so far
+    def continue_search(self):
+        self._search_job = None
+        done = self.search.run(self.frame_budget)
+        self.show_results()
+        if not done:
+            self._search_job = self.after(1, self.continue_search)
+
+    def show_results(self):
+        results = self.search.results()
+        # once ranked only the count changes; keep the selection
+        if results != self.results:
+            self.results = results
+            self.result_list.delete(0, tk.END)
+            if self.results:
+                self.result_list.insert(tk.END, *self.results)
+                self.result_list.selection_set(0)
+        if not self.search.query:
+            status = '%d files' % len(self.search.matcher.paths)
+        else:
+            status = '%d%s matches' % (len(self.search.matched), '' if self.search.complete else '+')
+        self.status_label.configure(text=status)
+
+    # search again once a refresh brings a new list
+    def poll_file_list(self):
+        self._poll_job = None
+        if self.files.matcher is not None and (self.search is None or self.search.matcher is not self.files.matcher):
+            self.search = None
+            self.start_search()
+        if self.files.refreshing or self.files.matcher is None:
+            self._poll_job = self.after(self.poll_interval, self.poll_file_list)
+
+    def move_selection(self, step):
+        if not self.results:
+            return 'break'
+        selection = self.result_list.curselection()
+        row = min(max((selection[0] if selection else -1) + step, 0), len(self.results) - 1)
+        self.result_list.selection_clear(0, tk.END)
+        self.result_list.selection_set(row)
+        self.result_list.see(row)
+        return 'break'
+
+    def on_open(self, event=None):
+        selection = self.result_list.curselection()
+        if selection:
+            path = os.path.join(self.files.root, self.results[selection[0]])
+            self.on_close()
+            self.editor.open_file_without_dialog(path)
+        return 'break'
+
+    def on_close(self):
+        for job in (self._search_job, self._poll_job):
+            if job is not None:
+                self.after_cancel(job)
+        self.destroy()
@@ -0,0 +1,161 @@
+import os
+import queue
+import shutil
+import threading
+
+
+class SaveEngine:
+    '''Writes document snapshots to disk on a background thread.
+
+    Each save goes to a temporary file next to the target, which is
+    flushed, fsynced and then renamed over it, so a failed or interrupted
+    write leaves the original untouched. Saving while a write is running
+    only replaces the snapshot queued behind it, so repeated saves
+    coalesce into at most one more write. Completion is reported on the
+    Tk thread through on_saved(path, error).'''
+
+    poll_interval = 20
+
+    def __init__(self, textarea):
+        self.textarea = textarea
+        self.results = queue.Queue()
+        self.pending = None
+        self._thread = None
+        self._poll_job = None
+
+    @property
+    def busy(self):
+        return self._thread is not None
+
+    def save(self, path, on_saved):
+        snapshot = self.textarea.document.snapshot()
+        if self.busy:
+            self.pending = (path, snapshot, on_saved)
+            return
+        self._start(path, snapshot, on_saved)
+
+    # block until every queued write has finished, for quitting
+    def flush(self):
+        while self.busy:
+            self._thread.join()
+            self._collect()
+
+    def _start(self, path, snapshot, on_saved):
+        self._thread = threading.Thread(target=self._write,
+                                        args=(path, snapshot, on_saved),
+                                        daemon=True)
+        self._thread.start()
+        if self._poll_job is None:
+            self._poll_job = self.textarea.after(self.poll_interval, self._poll)
+
+    def _write(self, path, snapshot, on_saved):
+        try:
+            write_atomically(path, snapshot.chunks())
+            error = None
+        except Exception as e:
+            error = e
+        self.results.put((path, error, on_saved))
+
+    def _poll(self):
+        self._poll_job = None
+        self._collect()
+        if self.busy:
+            self._poll_job = self.textarea.after(self.poll_interval, self._poll)
+
+    def _collect(self):
+        try:
+            path, error, on_saved = self.results.get_nowait()
+        except queue.Empty:
+            return
+        self._thread = None
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            self._start(*pending)
+        on_saved(path, error)
+
+
+def write_atomically(path, chunks):
+    '''Write chunks plus the final newline Tk keeps after the last line to
+    path by way of a fsynced temporary file in the same directory.
+
+    A symlink is followed and the file it points to replaced. A file with
+    other hard links cannot be renamed over without splitting it from
+    them, so the temporary file is copied into it once it is synced.'''
+    path = os.path.realpath(path)
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        info = None
+    directory = os.path.dirname(path)
+    if info is not None and info.st_nlink > 1:
+        _copy_over(path, directory, chunks)
+        return
+
+    # private until it has the mode of the file it replaces; a new file
+    # gets 0666 less the umask from the kernel, as any other would
+    fd, temp_path = _create_temp(directory, os.path.basename(path), 0o600 if info else 0o666)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            _write(f, chunks)
+        if info is not None:
+            os.chmod(temp_path, info.st_mode & 0o7777)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    # make the rename itself durable where directories can be synced
+    if hasattr(os, 'O_DIRECTORY'):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+
+# rewrite a hard linked file in place, only once the new text is safe in
+# a synced temporary file; if copying it over fails part way the
+# temporary file is kept and named in the error
+def _copy_over(path, directory, chunks):
+    fd, temp_path = _create_temp(directory, os.path.basename(path), 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            _write(f, chunks)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    try:
+        with open(temp_path, 'rb') as source, open(path, 'r+b') as target:
+            shutil.copyfileobj(source, target)
+            target.truncate()
+            target.flush()
+            os.fsync(target.fileno())
+    except OSError as e:
+        raise OSError(e.errno, '%s; the new text is in %s' % (e.strerror, temp_path), path) from e
+    os.remove(temp_path)
+
+
+def _write(f, chunks):
+    f.writelines(chunks)
+    f.write('\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+# a new hidden file next to the target, like tempfile.mkstemp but with
+# the given mode
+def _create_temp(directory, name, mode):
+    while True:
+        temp_path = os.path.join(directory, '.%s.%s.tmp' % (name, os.urandom(4).hex()))
+        try:
+            return os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode), temp_path
+        except FileExistsError:
+            continue
@@ -0,0 +1,30 @@
+class SpanAccumulator:
+    '''Collects token spans as Tk index pairs grouped by tag, so every tag
+    can be applied with a single multi-range "tag add" call.'''
+
+    # keep the argument list of a single Tcl call reasonably small
+    max_ranges_per_call = 4096
+
+    def __init__(self, spans=()):
+        self.ranges = {}
+        self.extend(spans)
+
+    def __len__(self):
+        return sum(len(indices) for indices in self.ranges.values()) // 2
+
+    def extend(self, spans):
+        ranges = self.ranges
+        for tag, line, col, end_line, end_col in spans:
+            indices = ranges.get(tag)
+            if indices is None:
+                indices = ranges[tag] = []
+            indices.append('%d.%d' % (line, col))
+            indices.append('%d.%d' % (end_line, end_col))
+
+    # issue the collected ranges, one call per tag (per max_ranges_per_call)
+    def apply(self, text_widget):
+        step = self.max_ranges_per_call * 2
+        for tag, indices in self.ranges.items():
+            for i in range(0, len(indices), step):
+                text_widget.tag_add_ranges(tag, indices[i:i + step])
+        self.ranges = {}
@@ -20,6 +20,7 @@ class Statusbar:
                          font=font_specs)
         
         self._label = label
+        self._revision = None
 
     # status update of the status bar
     def update_status(self, event):
@@ -41,6 +42,7 @@ class Statusbar:
             self.hide_status_bar()
 
     def display_status_message(self, message, msg_type='error'):
+        self._revision = self._parent.textarea.revision
         self.show_status_bar()
         self.status.set(message)
         if msg_type == 'save':
@@ -59,6 +61,11 @@ class Statusbar:
     def hint_color(self):
         self._label.config(bg='#8ec07c', fg='#282828')
 
+    # edits made after a message was shown make it stale
+    def on_text_change(self, change):
+        if 'edit' in change.kinds and change.revision != self._revision:
+            self.hide_status_bar()
+
     # hiding the status bar while in quiet mode
     def hide_status_bar(self):
         self._label.pack_forget()
@@ -1,13 +1,30 @@
 import tkinter as tk
-import math
-import yaml
+import time
 import tkinter.font as tk_font
-from pygments import lex
 from pygments.lexers import get_lexer_by_name
+from quiet_incremental_lexer import IncrementalLexer
+from quiet_lex_worker import LexWorker
+from quiet_loaders import load_config
+from quiet_spans import SpanAccumulator
+from quiet_themes import ThemeEngine, compile_styles, apply_styles
 
 class SyntaxHighlighting():
 
-    def __init__(self, parent, text_widget, initial_content):
+    # documents longer than this are highlighted around the viewport first
+    # and the rest is filled in by a background thread, or while the editor
+    # is idle when lex_in_thread is off
+    lazy_threshold_lines = 3000
+    viewport_margin_lines = 50
+    lex_in_thread = True
+    # lines lexed per slice and time allowed per idle callback
+    backfill_lines = 500
+    backfill_budget = 0.015
+    # ms between checks for lexed batches, and the pause in typing after
+    # which a worker cancelled by an edit starts again
+    worker_poll_interval = 10
+    worker_restart_delay = 250
+
+    def __init__(self, parent, text_widget):
         self.settings = parent.loader.load_settings_data()
         self.syntax = parent.loader.load_default_syntax()
         self.default_theme = parent.loader.load_default_theme()
@@ -16,8 +33,16 @@ class SyntaxHighlighting():
         self.text = text_widget
         self.font_family = parent.font_family
         self.font_size = parent.font_size
-        self.previousContent = initial_content
         self.lexer = get_lexer_by_name('python')
+        self.incremental = IncrementalLexer(self.lexer)
+        self.revision = text_widget.revision
+        self.visible_window = None
+        self.backfill_job = None
+        self.worker = LexWorker()
+        self.worker_job = None
+        self.worker_poll_job = None
+        # set while a file is streamed in; initial_highlight runs at the end
+        self.paused = False
 
         self.comment_tokens = self.syntax['comments']
         self.string_tokens = self.syntax['strings']
@@ -36,62 +61,168 @@ class SyntaxHighlighting():
         self.class_color = self.default_theme['class_self_color']
         self.object_color = self.default_theme['object_color']
         self.text_color = parent.font_color
+        self.themes = ThemeEngine()
+        self.styles = compile_styles(self.theme_colors(), self.syntax)
 
 
+    # re-highlight after whatever edits CustomText recorded since last time;
+    # key releases that changed nothing (arrows, modifiers) cost nothing
     def default_highlight(self):
-        row = float(self.text.index(tk.INSERT))
-        row = str(math.trunc(row))
-        content = self.text.get("1.0", tk.END)
-        lines = content.split("\n")
+        if self.paused:
+            return
+        changes = self.text.changes_since(self.revision)
+        if changes is None:
+            self.initial_highlight()
+            return
+        if not changes:
+            return
+        self.revision = self.text.revision
+
+        for revision, kind, start, old_end, new_end in changes:
+            self.incremental.edit(start[0], old_end[0], new_end[0])
+        self.highlight_dirty_lines(self.backfill_lines)
+        if self.incremental.pending:
+            self.visible_window = None
+            self.highlight_visible_lines()
+            self.schedule_backfill()
+
+    def get_line_count(self):
+        return self.text.document.line_count
+
+    # lines first..last for the lexer, from the document mirror rather
+    # than a Tcl round-trip
+    def get_text(self, first, last):
+        return self.text.document.get_lines(first, last), 0
+
+    # re-lex from the nearest checkpoint and retag only the lines that changed
+    def highlight_dirty_lines(self, max_lines=None):
+        self.apply_spans(self.incremental.relex(self.get_text, max_lines))
+
+    # tag the lines on screen (plus a margin) before the backfill reaches them
+    def highlight_visible_lines(self):
+        first = int(self.text.index('@0,0').split('.')[0])
+        last = int(self.text.index('@0,%d' % self.text.winfo_height()).split('.')[0])
+        if self.visible_window == (first, last):
+            return
+        self.visible_window = (first, last)
+        margin = self.viewport_margin_lines
+        self.apply_spans(self.incremental.lex_window(self.get_text, first - margin, last + margin))
+
+    # coalesced notification from the text widget: edits from anywhere
+    # (paste, undo, replace) get highlighted, and scrolling brings the new
+    # viewport to the front of the queue
+    def on_text_change(self, change):
+        if 'edit' in change.kinds:
+            self.default_highlight()
+        elif 'view' in change.kinds:
+            self.on_view_change()
+
+    def on_view_change(self):
+        if self.incremental.pending:
+            self.highlight_visible_lines()
+
+    def schedule_backfill(self):
+        if self.lex_in_thread:
+            self.schedule_lex_worker()
+        elif self.backfill_job is None:
+            self.backfill_job = self.text.after_idle(self.backfill)
+
+    def backfill(self):
+        self.backfill_job = None
+        deadline = time.perf_counter() + self.backfill_budget
+        while self.incremental.pending and time.perf_counter() < deadline:
+            self.highlight_dirty_lines(self.backfill_lines)
+        if self.incremental.pending:
+            self.schedule_backfill()
 
-        if (self.previousContent != content):
-            self.text.mark_set("range_start", row + ".0")
-            data = self.text.get(row + ".0", row + "." + str(len(lines[int(row) - 1])))
+    # (re)start the worker once typing pauses; edits make its results stale
+    def schedule_lex_worker(self):
+        if self.worker.running and self.worker.revision == self.text.revision:
+            return
+        self.worker.cancel()
+        if self.worker_job is not None:
+            self.text.after_cancel(self.worker_job)
+        self.worker_job = self.text.after(self.worker_restart_delay, self.start_lex_worker)
 
-            for token, content in lex(data, self.lexer):
-                self.text.mark_set("range_end", "range_start + %dc" % len(content))
-                self.text.tag_add(str(token), "range_start", "range_end")
-                self.text.mark_set("range_start", "range_end")
+    def start_lex_worker(self):
+        if self.worker_job is not None:
+            self.text.after_cancel(self.worker_job)
+            self.worker_job = None
+        if not self.incremental.pending:
+            return
+        self.worker.start(self.incremental, self.text.document.snapshot(), self.text.revision)
+        if self.worker_poll_job is None:
+            self.worker_poll_job = self.text.after(self.worker_poll_interval, self.poll_lex_worker)
 
-        self.previousContent = self.text.get("1.0", tk.END)
+    # apply finished batches on the Tk thread, a time-boxed handful at a time
+    def poll_lex_worker(self):
+        self.worker_poll_job = None
+        deadline = time.perf_counter() + self.backfill_budget
+        for revision, first, end, spans, states, frontier, dirty, tags in self.worker.batches():
+            if revision != self.text.revision:
+                self.schedule_lex_worker()
+                return
+            self.incremental.adopt(first, end, states, frontier, dirty, tags)
+            self.apply_spans((first, end, spans))
+            if time.perf_counter() >= deadline:
+                break
 
+        if self.worker.running:
+            self.worker_poll_job = self.text.after(self.worker_poll_interval, self.poll_lex_worker)
+
+    def apply_spans(self, result):
+        if result is None:
+            return
+        first, end, spans = result
+
+        start_index = '%d.0' % first
+        end_index = '%d.0' % end
+        for tag in self.incremental.tags:
+            self.text.tag_remove(tag, start_index, end_index)
+
+        SpanAccumulator(spans).apply(self.text)
+
+    def theme_colors(self):
+        return {'comment_color': self.comment_color,
+                'string_color': self.string_color,
+                'number_color': self.number_color,
+                'keyword_color': self.keyword_color,
+                'function_color': self.function_color,
+                'class_self_color': self.class_color,
+                'object_color': self.object_color,
+                'font_color': self.text_color}
+
+    # restyle the token tags from the compiled theme table; the tags
+    # themselves stay where they are
     def syntax_theme_configuration(self):
-        def configure_tokens(tokens, token_color):
-            if tokens:
-                for token in tokens:
-                    self.text.tag_configure(token, foreground=token_color)
-        configure_tokens(self.comment_tokens, self.comment_color)
-        configure_tokens(self.string_tokens, self.string_color)
-        configure_tokens(self.number_tokens, self.number_color)
-        configure_tokens(self.keyword_tokens, self.keyword_color)
-        configure_tokens(self.function_tokens, self.function_color)
-        configure_tokens(self.object_tokens, self.object_color)
-        configure_tokens(self.text_tokens, self.text_color)
-        if self.class_tokens:
-            for token in self.class_tokens:
-                self.text.tag_configure(token, foreground=self.class_color, font=self.parent.italics, size=self.font_size)
+        apply_styles(self.styles, self.text, self.parent.italics)
 
 
     def initial_highlight(self, *args):
-        for tag in self.text.tag_names():
+        # only the token tags; find highlights and the selection stay
+        for tag in self.incremental.tags:
             self.text.tag_delete(tag)
 
-        content = self.text.get("1.0", tk.END)
-        self.text.mark_set("range_start", "1.0")
-        data = self.text.get("1.0", tk.END)
-        for token, content in lex(data, self.lexer):
-            self.text.mark_set("range_end", "range_start + %dc" % len(content))
-            self.text.tag_add(str(token), "range_start", "range_end")
-            self.text.mark_set("range_start", "range_end")
-            
-        self.previousContent = self.text.get("1.0", tk.END)
+        self.revision = self.text.revision
+        self.worker.cancel()
+        self.incremental.reset(self.lexer, self.get_line_count())
+        self.visible_window = None
+        if self.incremental.line_count > self.lazy_threshold_lines:
+            self.highlight_visible_lines()
+            if self.lex_in_thread:
+                self.start_lex_worker()
+            else:
+                self.schedule_backfill()
+        else:
+            self.highlight_dirty_lines()
+
         self.syntax_theme_configuration()
 
 
+    # switch colours in place: no reload of the buffer, no re-lexing, and
+    # the undo stack is left alone
     def load_new_theme(self, path):
-
-        with open(path) as new_theme_config:
-            new_config = yaml.load(new_theme_config, Loader=yaml.FullLoader)
+        new_config = load_config(path)
 
         self.comment_color = new_config['comment_color']
         self.string_color = new_config['string_color']
@@ -111,11 +242,11 @@ class SyntaxHighlighting():
         settings['menubar_active_fg'] = new_config['menu_fg_active']  
         settings['menu_active_bg'] = new_config['menu_bg_active']
         settings['menu_active_fg'] = new_config['menu_fg_active']  
+        # the settings store notifies the editor of the changed colors
         self.parent.loader.store_settings_data(settings)
-        self.parent.reconfigure_settings()
-        self.parent.clear_and_replace_textarea()
 
-        self.initial_highlight()
+        self.styles = self.themes.styles_for(path, self.syntax)
+        self.syntax_theme_configuration()
 
 
     def load_new_tokens(self, new_syntax):
@@ -127,6 +258,9 @@ class SyntaxHighlighting():
         self.class_tokens = new_syntax['class_self']
         self.object_tokens = new_syntax['object_names']
         self.text_tokens = new_syntax['text']
+        self.syntax = new_syntax
+        self.themes.forget_syntax()
+        self.styles = compile_styles(self.theme_colors(), new_syntax)
         self.initial_highlight()
 
     def load_python3_syntax(self):
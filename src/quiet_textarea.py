@@ -1,7 +1,21 @@
 import tkinter as tk
-from tkinter import messagebox
+from collections import deque, namedtuple
+from quiet_document import Document, columns
+from quiet_find_engine import FindEngine
+
+# what changed since the last notification: the set of kinds ('edit',
+# 'cursor', 'view'), the lines touched by edits (None if there were none),
+# the revision afterwards and how many raw events were folded into it
+TextChange = namedtuple('TextChange', 'kinds first_line last_line revision merged')
+
+# widget commands that move the view
+VIEW_COMMANDS = (('xview', 'moveto'), ('xview', 'scroll'),
+                 ('yview', 'moveto'), ('yview', 'scroll'))
 
 class CustomText(tk.Text):
+    # edits remembered for consumers that read them with changes_since()
+    change_history = 4096
+
     def __init__(self, *args, **kwargs):
         tk.Text.__init__(self, *args, **kwargs)
 
@@ -11,13 +25,40 @@ class CustomText(tk.Text):
         self.tk.call('rename', self._w, self._orig)
         self.tk.createcommand(self._w, self._proxy)
         self.bg_color = '#272822'
+        # LargeFileView paging a file through this widget, if any
+        self.large_file = None
+
+        # every insert, delete and replace bumps the revision and is kept as
+        # (revision, kind, start, old_end, new_end) with (line, col) positions
+        self.revision = 0
+        self.changes = deque(maxlen=self.change_history)
+        # piece table kept in step with every edit, so readers of the whole
+        # text do not have to copy it out of Tcl
+        self.document = Document()
+        # EditJournal recording edits for crash recovery, if any
+        self.journal = None
+        # index of every match of the find window's query
+        self.find_engine = FindEngine(self)
+
+        # change notifications are collected during an event cycle and sent
+        # to subscribers once, when Tk goes idle
+        self.subscribers = []
+        self.events_received = 0
+        self.events_dispatched = 0
+        self._pending_kinds = set()
+        self._pending_events = 0
+        self._dirty_lines = None
+        self._dispatch_job = None
 
     def _proxy(self, *args):
         # let the actual widget perform the requested action
+        revision = self.revision
         try:
             cmd = (self._orig,) + args
             result = ''
-            if not self.isControlPressed:
+            if args[0] in ('insert', 'delete', 'replace'):
+                result = self._tracked_edit(cmd)
+            elif not self.isControlPressed:
                 # if command is not present, execute the event
                 result = self.tk.call(cmd)
             else:
@@ -27,53 +68,222 @@ class CustomText(tk.Text):
         except tk.TclError:
             result = ''
 
-        # generate an event if something was added or deleted,
-        # or the cursor position changed
-        if (args[0] in ('insert', 'replace', 'delete') or 
-            args[0:3] == ('mark', 'set', 'insert') or
-            args[0:2] == ('xview', 'moveto') or
-            args[0:2] == ('xview', 'scroll') or
-            args[0:2] == ('yview', 'moveto') or
-            args[0:2] == ('yview', 'scroll')
-        ):
-            self.event_generate('<<Change>>', when='tail')
+        # queue a notification if something was added or deleted,
+        # the cursor position changed or the view moved
+        if args[0] in ('insert', 'replace', 'delete'):
+            if self.revision != revision:
+                self._queue_change('edit', self.changes[-1])
+        elif args[0:3] == ('mark', 'set', 'insert'):
+            self._queue_change('cursor')
+        elif args[0:2] in VIEW_COMMANDS or args[0] == 'see':
+            self._queue_change('view')
 
         # return what the actual widget returned
         return result   
 
-    def find(self, text_to_find):
-        length = tk.IntVar()
-        index = self.search(text_to_find, self.find_search_starting_index, stopindex=tk.END, count=length)
+    def subscribe(self, callback):
+        '''Call callback(TextChange) at most once per event cycle after the
+        text, the cursor or the view changed.'''
+        self.subscribers.append(callback)
 
-        if index:
-            self.tag_remove('find_match', 1.0, tk.END)
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
 
-            end = f'{index}+{length.get()}c'
-            self.tag_add('find_match', index, end)
-            self.see(index)
+    @property
+    def events_merged(self):
+        return self.events_received - self.events_dispatched - self._pending_events
 
-            self.find_search_starting_index = end
-            self.find_match_index = index
-        else:
-            if self.find_match_index != 1.0:
-                if tk.messagebox.askyesno("No more results", "No further matches. Repeat from the beginning?"):
-                    self.find_search_starting_index = 1.0
-                    self.find_match_index = None
-                    return self.find(text_to_find)
+    def _queue_change(self, kind, change=None):
+        self.events_received += 1
+        self._pending_events += 1
+        self._pending_kinds.add(kind)
+        if change is not None:
+            start, old_end, new_end = change[2][0], change[3][0], change[4][0]
+            if self._dirty_lines is None:
+                self._dirty_lines = (start, new_end)
             else:
-                tk.messagebox.showinfo("No Matches", "No matching text found")
+                # lines below the edit moved by however many it added
+                first, last = self._dirty_lines
+                if last >= old_end:
+                    last += new_end - old_end
+                self._dirty_lines = (min(first, start), max(last, new_end))
+        if self._dispatch_job is None:
+            self._dispatch_job = self.after_idle(self._dispatch_changes)
 
-    def replace_text(self, target, replacement):
-        if self.find_match_index:
-            current_found_index_line = str(self.find_match_index).split('.')[0]
+    def _dispatch_changes(self):
+        self._dispatch_job = None
+        first, last = self._dirty_lines or (None, None)
+        change = TextChange(frozenset(self._pending_kinds), first, last,
+                            self.revision, self._pending_events)
+        self.events_dispatched += 1
+        self._pending_kinds = set()
+        self._pending_events = 0
+        self._dirty_lines = None
+        for callback in list(self.subscribers):
+            callback(change)
 
-            end = f"{self.find_match_index}+{len(target)}c"
-            self.replace(self.find_match_index, end, replacement)
+    # run an insert, delete or replace and record the range it touched
+    def _tracked_edit(self, cmd):
+        args = cmd[1:]
+        kind = args[0]
+        if self.tk.call(self._orig, 'cget', '-state') == 'disabled':
+            # Tk ignores edits to a disabled widget
+            return self.tk.call(cmd)
+        last = _position(self.tk.call(self._orig, 'index', 'end-1c'))
 
-            self.find_search_starting_index = current_found_index_line + '.0'
+        def resolve(index):
+            # the widget never edits past its final newline
+            return min(_position(self.tk.call(self._orig, 'index', index)), last)
+
+        document = self.document
+        journal = self.journal
+        if kind == 'insert':
+            start = old_end = resolve(args[1])
+            result = self.tk.call(cmd)
+            text = ''.join(args[2::2])
+            new_end = _advance(start, text)
+            document.insert(start, text)
+            if journal is not None:
+                journal.insert(start, text)
+        elif kind == 'replace':
+            start = resolve(args[1])
+            old_end = max(resolve(args[2]), start)
+            result = self.tk.call(cmd)
+            text = ''.join(args[3::2])
+            new_end = _advance(start, text)
+            document.delete(start, old_end)
+            document.insert(start, text)
+            if journal is not None:
+                journal.delete(start, old_end)
+                journal.insert(start, text)
+        elif len(args) <= 3:
+            start = resolve(args[1])
+            old_end = resolve(args[2] if len(args) == 3 else '%s +1c' % args[1])
+            if old_end <= start:
+                return self.tk.call(cmd)
+            result = self.tk.call(cmd)
+            new_end = start
+            document.delete(start, old_end)
+            if journal is not None:
+                journal.delete(start, old_end)
+        else:
+            # several ranges at once: track the span covering all of them
+            ranges = [resolve(index) for index in args[1:]]
+            start, old_end = min(ranges), max(ranges)
+            self.tk.call(self._orig, 'mark', 'set', 'change_end', '%d.%d' % old_end)
+            result = self.tk.call(cmd)
+            new_end = resolve('change_end')
+            document.reset(self.tk.call(self._orig, 'get', '1.0', 'end-1c'))
+            if journal is not None and not journal.paused:
+                journal.checkpoint(journal.filename)
+
+        if start == old_end == new_end:
+            return result
+        if document.astral:
+            self._check_document(start[0], new_end[0])
+        self.revision += 1
+        self.changes.append((self.revision, kind, start, old_end, new_end))
+        return result
+
+    # the document converts Tk columns around characters above the BMP;
+    # should the lines an edit touched still come out different from the
+    # widget, take the whole text from it again
+    def _check_document(self, first, last):
+        start, end = self._line_span(first, last)
+        if self.document.slice(start, end) == self.tk.call(self._orig, 'get', '%d.0' % first,
+                                                            '%d.0 lineend' % last):
+            return
+        self.document.reset(self.tk.call(self._orig, 'get', '1.0', 'end-1c'))
+        if self.journal is not None and not self.journal.paused:
+            self.journal.checkpoint(self.journal.filename)
+
+    def changes_since(self, revision):
+        '''Edits made after revision, oldest first. Returns None when they
+        are no longer all in the history and the caller has to resync.'''
+        changes = []
+        for change in reversed(self.changes):
+            if change[0] <= revision:
+                break
+            changes.append(change)
+        else:
+            if self.changes and self.changes[0][0] > revision + 1:
+                return None
+            if not self.changes and self.revision > revision:
+                return None
+        changes.reverse()
+        return changes
+
+    # add a tag to many ranges in one call, straight to the underlying
+    # widget since tagging never needs the change notification above
+    def tag_add_ranges(self, tag, indices):
+        if indices:
+            self.tk.call(self._orig, 'tag', 'add', tag, *indices)
+
+    def replace_lines(self, first, last, transform):
+        '''Replace lines first to last with transform(their text), without
+        the final newline, as one edit: one undo step and one change
+        notification however many lines there are. The cursor keeps its
+        place on its line. Returns False if nothing changed.'''
+        if self.large_file is not None:
+            return False
+        start, end = self._line_span(first, last)
+        text = self.document.slice(start, end)
+        new_text = transform(text)
+        if new_text == text:
+            return False
+        line, col = _position(self.index(tk.INSERT))
+        moved = first <= line <= last
+        if moved:
+            before = self._line_span(line, line)
+        self.edit_separator()
+        self.replace('%d.0' % first, '%d.0 lineend' % last, new_text)
+        self.edit_separator()
+        if moved:
+            after = self._line_span(line, line)
+            col += (after[1] - after[0]) - (before[1] - before[0])
+            self.mark_set(tk.INSERT, '%d.%d' % (line, max(col, 0)))
+        return True
+
+    # document offsets of the start of line first and the end of line last
+    def _line_span(self, first, last):
+        document = self.document
+        end = document.offset(last + 1, 0)
+        if last < document.line_count:
+            end -= 1
+        return document.offset(first, 0), end
+
+    def find(self, text_to_find, regex=False, case=True, whole_word=False):
+        if self.large_file is not None:
+            return self.large_file.find(text_to_find)
+        self.find_engine.search(text_to_find, regex, case, whole_word)
+        self.find_engine.next()
+
+    def replace_text(self, replacement):
+        if self.large_file is not None:
+            return
+        self.find_engine.replace_current(replacement)
+
+    # returns how many matches were replaced
+    def replace_all(self, text_to_find, replacement, regex=False, case=True, whole_word=False):
+        if self.large_file is not None:
+            return 0
+        self.find_engine.search(text_to_find, regex, case, whole_word)
+        return self.find_engine.replace_all(replacement)
 
     def cancel_find(self):
-        self.find_search_starting_index = 1.0
-        self.find_match_index = None
-        self.tag_remove('find_match', 1.0, tk.END)
+        if self.large_file is not None:
+            return self.large_file.cancel_find()
+        self.find_engine.clear()
+
+
+def _position(index):
+    line, col = index.split('.')
+    return int(line), int(col)
+
 
+# position just after text inserted at start
+def _advance(start, text):
+    newlines = text.count('\n')
+    if newlines:
+        return start[0] + newlines, columns(text[text.rindex('\n') + 1:])
+    return start[0], start[1] + columns(text)
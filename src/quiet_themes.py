@@ -0,0 +1,56 @@
+from quiet_loaders import load_config
+
+# syntax config lists paired with the theme colour they take, in the order
+# the tags were always configured (later lists win for shared tokens)
+TOKEN_COLORS = (
+    ('comments', 'comment_color'),
+    ('strings', 'string_color'),
+    ('numbers', 'number_color'),
+    ('keywords', 'keyword_color'),
+    ('functions', 'function_color'),
+    ('object_names', 'object_color'),
+    ('text', 'font_color'),
+)
+
+
+class ThemeEngine:
+    '''Turns a theme and the current syntax token lists into a table of
+    token tag -> (foreground, italic), so switching themes is a handful of
+    tag_configure calls and never touches the text or its tags.
+
+    Compiled tables are kept per theme file along with the config they
+    were built from, until the syntax or the file changes.'''
+
+    def __init__(self):
+        self.compiled = {}
+
+    # the table for a theme file, compiled against the current syntax;
+    # load_config only rereads the file once it changed on disk
+    def styles_for(self, path, syntax):
+        config = load_config(path)
+        cached = self.compiled.get(path)
+        if cached is None or cached[0] != config:
+            cached = self.compiled[path] = (config, compile_styles(config, syntax))
+        return cached[1]
+
+    # compiled tables only hold for the token lists they were built from
+    def forget_syntax(self):
+        self.compiled.clear()
+
+
+def compile_styles(colors, syntax):
+    styles = {}
+    for tokens_key, color_key in TOKEN_COLORS:
+        for token in syntax.get(tokens_key) or ():
+            styles[token] = (colors[color_key], False)
+    for token in syntax.get('class_self') or ():
+        styles[token] = (colors['class_self_color'], True)
+    return styles
+
+
+def apply_styles(styles, text_widget, italics):
+    for tag, (foreground, italic) in styles.items():
+        if italic:
+            text_widget.tag_configure(tag, foreground=foreground, font=italics)
+        else:
+            text_widget.tag_configure(tag, foreground=foreground)
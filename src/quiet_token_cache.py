@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import struct
+from array import array
+
+import pygments
+
+MAGIC = b'QTC2'
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'quiet-text', 'tokens')
+
+
+class TokenCache:
+    '''On-disk cache of lexed documents, so reopening a large file does not
+    run pygments again.
+
+    Entries are keyed by a hash of the content, the lexer and the pygments
+    version. Each file holds a small JSON header (tag names and state
+    stacks) followed by the spans as (offset, length, tag id) triples and
+    one state id per line, all as flat arrays. Reading an entry marks it as
+    recently used; once the directory grows past max_bytes the least
+    recently used entries are removed.'''
+
+    max_bytes = 256 * 1024 * 1024
+
+    def __init__(self, path=None):
+        self.path = path or default_cache_dir()
+
+    def key(self, text, lexer):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(MAGIC)
+        digest.update(('%s\0%s\0' % (lexer.name, pygments.__version__)).encode('utf-8'))
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def load(self, key, offsets):
+        '''Returns (spans, states, tags) for the document whose line start
+        offsets are given, or None on a miss.'''
+        path = os.path.join(self.path, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        if data[:4] != MAGIC:
+            return None
+
+        try:
+            header_size, = struct.unpack_from('<I', data, 4)
+            header = json.loads(data[8:8 + header_size].decode('utf-8'))
+            position = 8 + header_size
+            triples = array('I')
+            triples.frombytes(data[position:position + header['span_bytes']])
+            position += header['span_bytes']
+            state_ids = array('i')
+            state_ids.frombytes(data[position:])
+        except (ValueError, KeyError, struct.error):
+            return None
+        if len(state_ids) != len(offsets) + 1:
+            return None
+
+        tags = header['tags']
+        table = [tuple(stack) for stack in header['states']]
+        states = [table[i] if i >= 0 else None for i in state_ids]
+        return _spans_from_triples(triples, tags, offsets), states, tags
+
+    def store(self, key, offsets, spans, states):
+        tags = []
+        tag_ids = {}
+        triples = array('I')
+        line_offset = offsets.__getitem__
+        for tag, line, col, end_line, end_col in spans:
+            tag_id = tag_ids.get(tag)
+            if tag_id is None:
+                tag_id = tag_ids[tag] = len(tags)
+                tags.append(tag)
+            start = line_offset(line - 1) + col
+            triples.extend((start, line_offset(end_line - 1) + end_col - start, tag_id))
+
+        table = []
+        state_index = {}
+        state_ids = array('i')
+        for state in states:
+            if state is None:
+                state_ids.append(-1)
+                continue
+            state_id = state_index.get(state)
+            if state_id is None:
+                state_id = state_index[state] = len(table)
+                table.append(list(state))
+            state_ids.append(state_id)
+
+        span_bytes = triples.tobytes()
+        header = json.dumps({'tags': tags, 'states': table,
+                             'span_bytes': len(span_bytes)}).encode('utf-8')
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            temp_path = os.path.join(self.path, key + '.tmp')
+            with open(temp_path, 'wb') as f:
+                f.write(MAGIC)
+                f.write(struct.pack('<I', len(header)))
+                f.write(header)
+                f.write(span_bytes)
+                f.write(state_ids.tobytes())
+            os.replace(temp_path, os.path.join(self.path, key))
+            self.evict()
+        except OSError:
+            pass
+
+    # drop least recently used entries until the cache fits max_bytes
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file():
+                    info = entry.stat()
+                    entries.append((info.st_mtime, info.st_size, entry.path))
+                    total += info.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+# walk the (offset, length, tag id) triples in document order, turning
+# offsets into line/col with the line start offsets
+def _spans_from_triples(triples, tags, offsets):
+    spans = []
+    line = 1
+    line_count = len(offsets) - 1
+    for i in range(0, len(triples), 3):
+        start = triples[i]
+        end = start + triples[i + 1]
+        while line < line_count and offsets[line] <= start:
+            line += 1
+        end_line = line
+        while end_line <= line_count and offsets[end_line] <= end:
+            end_line += 1
+        spans.append((tags[triples[i + 2]], line, start - offsets[line - 1],
+                      end_line, end - offsets[end_line - 1]))
+    return spans
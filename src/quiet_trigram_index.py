@@ -0,0 +1,306 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+from array import array
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+EMPTY = array('I')
+# parts of a regex that match no text, so the literals either side of
+# them are next to each other in the file
+ZERO_WIDTH = (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT)
+# ASCII letters a case insensitive search also finds as non-ASCII ones:
+# dotted and dotless i, the long s and the Kelvin sign
+NON_ASCII_FOLDS = frozenset('iskISK')
+REPEATS = tuple(getattr(sre_constants, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                if hasattr(sre_constants, name))
+
+
+def default_index_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'quiet-text', 'trigrams')
+
+
+# runs in a pool process; the sorted trigram keys of every file, or None
+# for files that could not be read
+def file_trigrams(paths):
+    found = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read().lower()
+        except OSError:
+            found.append(None)
+            continue
+        if b'\0' in data[:8192]:
+            # binary files are never grepped, so they need no trigrams
+            found.append(EMPTY)
+            continue
+        found.append(array('I', sorted(a << 16 | b << 8 | c for a, b, c in set(zip(data, data[1:], data[2:])))))
+    return found
+
+
+def required_trigrams(pattern):
+    '''Trigram keys every match of a compiled pattern contains, or None if
+    there is no literal text of three characters to go by.
+
+    Only ASCII trigrams are used and the index is lowercased, so a key
+    holds whatever the case of the query. A case insensitive search for
+    i, s or k also matches letters outside ASCII that the index does not
+    hold, so such patterns get None and every file is searched.'''
+    runs = []
+    run = []
+    ignore_case = pattern.flags & re.IGNORECASE and not pattern.flags & re.ASCII
+
+    def walk(items):
+        nonlocal run, ignore_case
+        for op, av in items:
+            if op is sre_constants.LITERAL:
+                run.append(chr(av))
+            elif op in ZERO_WIDTH:
+                continue
+            elif op is sre_constants.SUBPATTERN:
+                ignore_case = ignore_case or av[1] & re.IGNORECASE
+                # a group's text is contiguous with what is around it
+                walk(av[-1])
+            else:
+                runs.append(''.join(run))
+                run = []
+                if op in REPEATS and av[0] >= 1:
+                    walk(av[2])
+                    runs.append(''.join(run))
+                    run = []
+
+    try:
+        walk(sre_parse.parse(pattern.pattern, pattern.flags))
+    except Exception:
+        return None
+    runs.append(''.join(run))
+    if ignore_case and any(NON_ASCII_FOLDS.intersection(text) for text in runs):
+        return None
+    keys = set()
+    for text in runs:
+        data = text.encode('utf-8').lower()
+        for a, b, c in zip(data, data[1:], data[2:]):
+            if a < 128 and b < 128 and c < 128:
+                keys.add(a << 16 | b << 8 | c)
+    return keys or None
+
+
+class Selection:
+    '''The files of a folder a search has to grep, according to the index
+    at the time the search started.'''
+
+    def __init__(self, relative, files, ids):
+        self.relative = relative
+        self.files = files
+        self.ids = ids
+        # files found changed since they were indexed, and files the
+        # index let the search skip
+        self.stale = 0
+        self.skipped = 0
+
+    def needs(self, path, info):
+        entry = self.files.get(self.relative(path))
+        if entry is None or entry[1] != info.st_mtime_ns or entry[2] != info.st_size:
+            self.stale += 1
+            return True
+        if entry[0] < 0 or self.ids is None or entry[0] in self.ids:
+            return True
+        self.skipped += 1
+        return False
+
+
+class TrigramIndex:
+    '''On-disk index of the lowercased trigrams in every file under a
+    folder, to narrow a search to the files that can match before they
+    are grepped.
+
+    Each file has an id and every trigram a sorted posting list of the
+    ids of the files holding it. A file that changed, going by its mtime
+    and size, gets a new id and its old one is left dead in the posting
+    lists until there are more dead ids than live ones and the lists are
+    compacted. Once the lists hold max_postings ids, and for files over
+    max_file_bytes, files are recorded without trigrams and always
+    grepped, which keeps the index to about 4 bytes per posting.
+
+    The index is pickled to default_index_dir(), one file per folder, and
+    only the max_indexes most recently saved are kept. Searches read it
+    through select() while an update runs on another thread; the lock
+    guards the switch between the two.'''
+
+    version = 1
+    max_postings = 16 << 20
+    max_file_bytes = 4 << 20
+    max_indexes = 8
+
+    def __init__(self, root, path=None):
+        self.root = os.path.abspath(root)
+        self.prefix = os.path.join(self.root, '')
+        name = hashlib.sha1(self.root.encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+        self.path = path or os.path.join(default_index_dir(), name + '.pickle')
+        self.lock = threading.Lock()
+        # path relative to root -> (id, mtime_ns, size), id -1 for files
+        # without trigrams
+        self.files = {}
+        self.postings = {}
+        self.posting_count = 0
+        self.next_id = 0
+        self.dead = 0
+        # time.time() the last update finished, None before the first
+        self.updated = None
+        self.loaded = False
+
+    def relative(self, path):
+        return path[len(self.prefix):] if path.startswith(self.prefix) else os.path.relpath(path, self.root)
+
+    @property
+    def size_bytes(self):
+        return self.posting_count * EMPTY.itemsize
+
+    def select(self, pattern):
+        keys = required_trigrams(pattern)
+        with self.lock:
+            files = dict(self.files)
+            if keys is None:
+                return Selection(self.relative, files, None)
+            lists = sorted((self.postings.get(key, EMPTY) for key in keys), key=len)
+            ids = set(lists[0])
+            for ids_with_key in lists[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(ids_with_key)
+        return Selection(self.relative, files, ids)
+
+    def changed(self, relative, info):
+        entry = self.files.get(relative)
+        return entry is None or entry[1] != info.st_mtime_ns or entry[2] != info.st_size
+
+    # record a file's trigrams, or None to index it without any
+    def add(self, relative, info, keys):
+        with self.lock:
+            self._drop(relative)
+            if keys is None or self.posting_count + len(keys) > self.max_postings:
+                self.files[relative] = (-1, info.st_mtime_ns, info.st_size)
+                return
+            file_id = self.next_id
+            self.next_id += 1
+            postings = self.postings
+            for key in keys:
+                ids = postings.get(key)
+                if ids is None:
+                    postings[key] = array('I', (file_id,))
+                else:
+                    ids.append(file_id)
+            self.posting_count += len(keys)
+            self.files[relative] = (file_id, info.st_mtime_ns, info.st_size)
+
+    def remove(self, relative):
+        with self.lock:
+            self._drop(relative)
+            self.files.pop(relative, None)
+
+    def _drop(self, relative):
+        entry = self.files.get(relative)
+        if entry is not None and entry[0] >= 0:
+            self.dead += 1
+
+    def compact(self):
+        '''Drop dead ids from the posting lists, if there are more of them
+        than live ones.'''
+        if self.dead <= len(self.files):
+            return
+        live = {entry[0] for entry in self.files.values() if entry[0] >= 0}
+        postings = {}
+        count = 0
+        for key, ids in self.postings.items():
+            ids = array('I', [file_id for file_id in ids if file_id in live])
+            if ids:
+                postings[key] = ids
+                count += len(ids)
+        with self.lock:
+            self.postings = postings
+            self.posting_count = count
+            self.dead = 0
+
+    def load(self):
+        '''Read the saved index, if there is one for this folder.'''
+        self.loaded = True
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return
+        if data.get('version') != self.version or data.get('root') != self.root:
+            return
+        with self.lock:
+            self.files = data['files']
+            self.postings = data['postings']
+            self.posting_count = data['posting_count']
+            self.next_id = data['next_id']
+            self.dead = data['dead']
+            self.updated = data['updated']
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            data = {'version': self.version, 'root': self.root, 'files': self.files,
+                    'postings': self.postings, 'posting_count': self.posting_count,
+                    'next_id': self.next_id, 'dead': self.dead, 'updated': self.updated}
+            temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temp_path, 'wb') as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+        self._prune(directory)
+
+    # keep only the most recently saved indexes
+    def _prune(self, directory):
+        try:
+            saved = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.pickle')]
+            saved.sort(key=os.path.getmtime, reverse=True)
+            for path in saved[self.max_indexes:]:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def describe(self, stale=None):
+        '''How big and how old the index is, for the status readout.'''
+        if self.updated is None:
+            return 'Index: not built yet'
+        age = time.time() - self.updated
+        if age < 60:
+            when = 'just now'
+        elif age < 3600:
+            when = '%d min ago' % (age // 60)
+        elif age < 86400:
+            when = '%d h ago' % (age // 3600)
+        else:
+            when = '%d days ago' % (age // 86400)
+        status = 'Index: %d files, %.1f MB, updated %s' % (len(self.files), self.size_bytes / (1 << 20), when)
+        if stale:
+            status += ', %d changed since' % stale
+        return status
+
+
+# indexes already in use, by folder
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def trigram_index(root):
+    '''The shared TrigramIndex of a folder, not loaded yet when new.'''
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = TrigramIndex(root)
+        return index